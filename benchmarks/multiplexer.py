@@ -0,0 +1,127 @@
+#! /usr/bin/env python3
+
+# Copyright (C) 2017 Bengt Martensson.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see http://www.gnu.org/licenses/.
+
+"""
+Cost per connection of lirconian.multiplexer, against a fake Lirc server
+running in a separate process (so that its threads are not counted).
+
+Measures the memory per idle connection (Python allocations, and
+resident set size), the CPU time of an idle loop iteration, of the
+delivery of a broadcast button event to every connection, and of one
+VERSION round trip on every connection.
+"""
+
+from __future__ import print_function
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                '..'))
+
+# pylint: disable=wrong-import-position
+from lirconian.multiplexer import LircMultiplexer
+
+
+def _rss():
+    """Current resident set size in bytes (Linux), else the peak."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGESIZE')
+    except (IOError, OSError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _report(name, value, unit):
+    print("{0:45} {1:>12.1f} {2}".format(name, value, unit))
+
+
+def _cpu():
+    return time.process_time()
+
+
+def main():
+    """Runs the measurements, and prints the results."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('-n', '--connections', type=int, default=1000,
+                        help='Number of connections, default 1000')
+    args = parser.parse_args()
+    count = args.connections
+
+    server = subprocess.Popen(
+        [sys.executable, '-c',
+         'import sys; sys.argv[0] = "fake_lircd"; '
+         'from lirconian.fake_lircd import main; main()',
+         '-p', '0'],
+        stdout=subprocess.PIPE,
+        env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)))
+    try:
+        # "Serving on <port>"
+        port = int(server.stdout.readline().split()[-1])
+        mux = LircMultiplexer()
+        tracemalloc.start()
+        rss = _rss()
+        before = tracemalloc.get_traced_memory()[0]
+        events = []
+        connections = [mux.tcp('localhost', port,
+                               on_event=lambda c, e: events.append(e))
+                       for _ in range(count)]
+        futures = [connection.get_version() for connection in connections]
+        while not all(future.done() for future in futures):
+            mux.run_once(1)
+        for future in futures:
+            future.result()
+        del futures
+        allocated = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        _report("memory per connection, Python objects",
+                allocated / float(count), "bytes")
+        _report("memory per connection, resident",
+                (_rss() - rss) / float(count), "bytes")
+
+        iterations = 1000
+        start = _cpu()
+        for _ in range(iterations):
+            mux.run_once(0)
+        _report("idle loop iteration, {0} connections".format(count),
+                (_cpu() - start) / iterations * 1e6, "us")
+
+        start = _cpu()
+        connections[0].send("SIMULATE 0000000000000a90 00 KEY_POWER tv")
+        while len(events) < count:
+            mux.run_once(1)
+        _report("broadcast event, per connection",
+                (_cpu() - start) / count * 1e6, "us CPU")
+
+        start = time.perf_counter()
+        futures = [connection.get_version() for connection in connections]
+        while not all(future.done() for future in futures):
+            mux.run_once(1)
+        _report("VERSION on every connection, per connection",
+                (time.perf_counter() - start) / count * 1e6, "us")
+        mux.close()
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
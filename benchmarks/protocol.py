@@ -0,0 +1,134 @@
+#! /usr/bin/env python3
+
+# Copyright (C) 2017 Bengt Martensson.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see http://www.gnu.org/licenses/.
+
+"""
+Protocol benchmarks, run against the fake Lirc server in lirconian.fake_lircd.
+
+Measures send_ir_command throughput (one round trip per command, and
+pipelined), get_commands latency for a large remote, reply parser
+throughput, and connection setup cost, over a Unix domain socket and TCP.
+"""
+
+from __future__ import print_function
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                '..'))
+
+# pylint: disable=wrong-import-position
+from lirconian import UnixDomainSocketLirconian, TcpLirconian
+from lirconian.fake_lircd import FakeLircd, make_catalog
+from lirconian.reply_parser import ReplyParser, FastReplyParser
+
+
+def _timed(function, repeat):
+    """Returns the best time of repeat calls of function."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def _report(name, value, unit):
+    print("{0:45} {1:>12.1f} {2}".format(name, value, unit))
+
+
+def bench_send(lirc, label, count, repeat):
+    """Throughput of send_ir_command and of send_ir_command_sequence."""
+    elapsed = _timed(lambda: [lirc.send_ir_command('remote0', 'KEY_1', 1)
+                              for _ in range(count)], repeat)
+    _report("send_ir_command, " + label, count / elapsed, "ops/s")
+    sequence = [('remote0', 'KEY_1', 1)] * count
+    elapsed = _timed(lambda: lirc.send_ir_command_sequence(sequence), repeat)
+    _report("send_ir_command_sequence, " + label, count / elapsed, "ops/s")
+
+
+def bench_get_commands(lirc, label, remote, repeat):
+    """Latency of get_commands for a large remote."""
+    elapsed = _timed(lambda: lirc.get_commands(remote), repeat)
+    _report("get_commands (large remote), " + label, elapsed * 1000, "ms")
+
+
+def bench_parsers(lines, repeat):
+    """Throughput of the reply parsers on a recorded LIST reply."""
+    def run(parser_class, packet):
+        parser = parser_class()
+        for line in packet:
+            parser.feed(line)
+        return parser.data
+
+    text = [line.decode("US-ASCII") for line in lines]
+    elapsed = _timed(lambda: run(ReplyParser, text), repeat)
+    _report("ReplyParser.feed", len(lines) / elapsed, "lines/s")
+    elapsed = _timed(lambda: run(FastReplyParser, lines), repeat)
+    _report("FastReplyParser.feed", len(lines) / elapsed, "lines/s")
+    elapsed = _timed(lambda: FastReplyParser().feed_lines(lines), repeat)
+    _report("FastReplyParser.feed_lines", len(lines) / elapsed, "lines/s")
+
+
+def bench_connect(factory, label, count, repeat):
+    """Cost of connecting, and doing one VERSION command."""
+    def run():
+        for _ in range(count):
+            lirc = factory()
+            lirc.get_version()
+            lirc.close()
+    elapsed = _timed(run, repeat)
+    _report("connect + VERSION, " + label, elapsed / count * 1e6, "us")
+
+
+def main():
+    """Runs the benchmarks, and prints the results."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('-n', '--count', type=int, default=2000,
+                        help='Number of commands per measurement')
+    parser.add_argument('-c', '--commands', type=int, default=20000,
+                        help='Number of commands of the large remote')
+    parser.add_argument('-l', '--latency', type=float, default=0.0,
+                        help='Reply latency of the fake server in seconds')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='Number of repetitions; the best is reported')
+    args = parser.parse_args()
+
+    catalog = make_catalog(2, 50)
+    catalog['large'] = make_catalog(1, args.commands)['remote0']
+    socket_path = os.path.join(tempfile.mkdtemp(), 'lircd')
+    with FakeLircd(socket_path, 0, catalog=catalog,
+                   latency=args.latency) as server:
+        for label, factory in (
+                ('unix', lambda: UnixDomainSocketLirconian(socket_path)),
+                ('tcp', lambda: TcpLirconian('localhost', server.port))):
+            lirc = factory()
+            bench_send(lirc, label, args.count, args.repeat)
+            bench_get_commands(lirc, label, 'large', args.repeat)
+            lirc.close()
+            bench_connect(factory, label, min(args.count, 500), args.repeat)
+        reply = server.reply('LIST large') + '\n'
+        bench_parsers(reply.encode("US-ASCII").split(b'\n')[:-1],
+                      args.repeat)
+    os.rmdir(os.path.dirname(socket_path))
+
+
+if __name__ == "__main__":
+    main()
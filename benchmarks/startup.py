@@ -0,0 +1,94 @@
+#! /usr/bin/env python3
+
+# Copyright (C) 2017 Bengt Martensson.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see http://www.gnu.org/licenses/.
+
+"""
+Startup time benchmark, based on "python -X importtime".
+
+For each scenario, the cumulative import time of the named module is
+measured (median of several runs), and compared to its budget.
+Also checks that importing the API does not drag in the command line
+machinery. Exits with status 1 if a budget is exceeded.
+
+The budgets assume that byte code is cached (i.e. not running with
+PYTHONDONTWRITEBYTECODE); use --scale for slower machines.
+"""
+
+from __future__ import print_function
+import argparse
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.realpath(__file__))
+TOP = os.path.join(HERE, '..')
+
+# Scenario: (description, code, module, budget in microseconds,
+#            modules that must not be imported)
+SCENARIOS = [
+    ('API', 'import lirconian', 'lirconian', 15000,
+     ['argparse', 're', 'json', 'lirconian.cli']),
+    ('entry point', 'import lirconian.daemon', 'lirconian.daemon', 17000,
+     ['argparse', 're', 'json', 'lirconian.cli']),
+    ('CLI', 'import lirconian.cli', 'lirconian.cli', 25000, []),
+]
+
+
+def _import_times(code):
+    """
+    Runs code in a fresh interpreter with -X importtime,
+    returns a dictionary module -> cumulative import time (us).
+    """
+    env = dict(os.environ, PYTHONPATH=TOP)
+    stderr = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        env=env, stderr=subprocess.PIPE, stdout=subprocess.DEVNULL,
+        check=True).stderr.decode()
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        times[module.strip()] = int(cumulative)
+    return times
+
+
+def main():
+    """Runs the scenarios, prints a report, exits 1 if over budget."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('-n', '--runs', type=int, default=7,
+                        help='Number of runs per scenario, default 7')
+    parser.add_argument('-s', '--scale', type=float, default=1.0,
+                        help='Factor applied to all budgets, default 1')
+    args = parser.parse_args()
+
+    failed = False
+    for description, code, module, budget, forbidden in SCENARIOS:
+        runs = [_import_times(code) for _ in range(args.runs)]
+        median = sorted(run[module] for run in runs)[len(runs) // 2]
+        budget = int(budget * args.scale)
+        imported = [name for name in forbidden if name in runs[0]]
+        ok = median <= budget and not imported
+        failed = failed or not ok
+        print("{0:12} {1:>8} us  (budget {2} us)  {3}".format(
+            description, median, budget, "OK" if ok else "FAIL"))
+        if imported:
+            print("             unwanted imports: " + ", ".join(imported))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
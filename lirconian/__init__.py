@@ -24,8 +24,8 @@ organized as a program with subcommands, send-once, etc.
 There are some other subtile differences from irsend:
 
 * subcommands have been renamed, and must be lower case,
-* send-once has been renamed to send; only takes one command
-  (irsend takes several),
+* send-once has been renamed to send; takes one or more commands,
+  like irsend,
 * send-stop (renamed to stop) without arguments uses the remote and
   the command from the last send-start command
    (API only; not from the command line),
@@ -39,6 +39,8 @@ There are some other subtile differences from irsend:
   is not recognized,
 * verbose option --verbose (-v); echos all communication with the Lirc server,
 * selectable timeout with --timeout (-t) option,
+* batch subcommand, executing several subcommands, one per line,
+  over one connection,
 * better error messages
 
 It does not depend on anything but standard Python libraries.
@@ -49,19 +51,28 @@ https://github.com/bengtmartensson/JavaLircClient
 """
 
 from __future__ import print_function
-import argparse
+import collections
 import socket
 import sys
-import re
-import os
+import select
+import time
 
-from .reply_parser import ReplyParser, BadPacketException
+try:
+    from _thread import allocate_lock
+except ImportError:                                     # Python 2
+    from thread import allocate_lock
+
+from .reply_parser import FastReplyParser, BadPacketException
+from .catalog import Catalog
+from .line_reader import LineReader, DEFAULT_CHUNK_SIZE
+from .events import parse_event, EVENT_BUFFER_SIZE
+from .catalog import _now
 
 VERSION = "0.2.1"
 DEFAULT_LIRC_DEVICE = '/var/run/lirc/lircd'
 DEFAULT_PORT = 8765
 
-_READCHUNKLENGTH = 4096
+_HEX_DIGITS = '0123456789abcdefABCDEF'
 
 
 class LircServerException(Exception):
@@ -82,37 +93,228 @@ class ClientInstantiationError(Exception):
     pass
 
 
+# Errors after which a connection is considered broken.
+CONNECTION_ERRORS = (socket.error, BadPacketException)
+
+
 class AbstractLirconian:
     """
     Abstract base class for the Lirconian. To implement the class,
     the abstract "socket" needs to be assigned to something sensible.
     """
 
-    def __init__(self, verbose):
-        self._verbose = verbose
+    def __init__(self, verbose, chunk_size=DEFAULT_CHUNK_SIZE):
+        self._verbose = False
+        self._tracer = None
         self._socket = None
-        self._in_buffer = bytearray(0)
-        self._last_command = None
-        self._last_remote = None
+        self._timeout = None
+        self._retry_policy = None
+        self._deadline = None
+        self._expires = None
+        self._scheduler = None
+        self._reader = LineReader(chunk_size)
+        self._repeats = collections.OrderedDict()
+        # Also used by the lease watchdog thread.
+        self._repeats_lock = allocate_lock()
+        self._last_repeat = (None, None)
+        self._catalog = None
+        self._transmitters = None
+        self._code_database = None
+        self._command_indexes = {}
+        self._events = collections.deque(maxlen=EVENT_BUFFER_SIZE)
+        self._broadcast_parser = FastReplyParser(self._events)
+        self._timing_hooks = []
+        self.set_verbose(verbose)
 
     def close(self):
-        """Close the connection."""
-        self._socket.close()
+        """
+        Close the connection, and stop capturing. Leased repeats
+        (see lease_repeat) are stopped first.
+        """
+        with self._repeats_lock:
+            leases = [lease for lease in self._repeats.values()
+                      if lease is not None]
+        for lease in leases:
+            try:
+                lease.stop()
+            except Exception:  # pylint: disable=broad-except
+                pass
+        if self._socket is not None:
+            self._socket.close()
+        if self._tracer is not None:
+            self._tracer.close()
+
+    def _connect(self):
+        """Creates and connects self._socket."""
+        self._socket = self._new_socket()
+
+    def _new_socket(self):
+        """Returns a new socket, connected to the Lirc server."""
+        raise NotImplementedError
+
+    def reconnect(self):
+        """
+        Closes the connection (if open), and opens a new one.
+        Input not yet read is discarded, and the catalog cache and the
+        remembered transmitters are invalidated, since the Lirc server may
+        have been restarted.
+        """
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+        self._reader = LineReader(self._reader.chunk_size)
+        self._broadcast_parser = FastReplyParser(self._events)
+        self._on_sighup()
+        self._connect()
+
+    def set_retry_policy(self, policy):
+        """
+        Sets the retry.RetryPolicy applied to the commands, None (the
+        default) for none. With a policy, a connection is considered
+        broken after an error, and reopened by the next command.
+        """
+        self._retry_policy = policy
 
-    def _read_line(self):
+    def set_deadline(self, deadline):
         """
-        Return a line read from the socket.
-        The input from the socket is buffered.
+        Sets the maximal time in seconds that a command (including its
+        retries and the pauses in between) may take, or None for no limit.
+        If it is exceeded, socket.timeout is thrown. (The timeout of
+        set_timeout still applies to each single socket operation.)
         """
-        newline = b'\n'
-        while newline not in self._in_buffer:
-            self._in_buffer += self._socket.recv(_READCHUNKLENGTH)
-        line, self._in_buffer = self._in_buffer.split(newline, 1)
-        return line.decode("US-ASCII")
+        self._deadline = deadline
+
+    def set_scheduler(self, scheduler):
+        """
+        Sets the scheduler.CommandScheduler admitting the commands of this
+        connection, normally one shared by all users of the Lirc server;
+        None (the default) for none.
+        """
+        self._scheduler = scheduler
+
+    def set_chunk_size(self, chunk_size):
+        """Sets the maximal number of bytes read from the socket at a time."""
+        self._reader.chunk_size = chunk_size
 
     def _send_string(self, cmd):
         """Sends a string to the Lirc server."""
-        self._socket.send(bytearray(cmd, 'US-ASCII'))
+        self._apply_deadline()
+        self._socket.sendall(bytearray(cmd, 'US-ASCII'))
+
+    def _apply_deadline(self):
+        """
+        Called before every socket operation: within a command with a
+        deadline, limits the socket timeout to the time left, or throws
+        socket.timeout if there is none.
+        """
+        if self._expires is None:
+            return
+        remaining = self._expires - _now()
+        if remaining <= 0:
+            raise socket.timeout("Deadline of {0}s exceeded"
+                                 .format(self._deadline))
+        self._socket.settimeout(remaining if self._timeout is None
+                                else min(remaining, self._timeout))
+
+    def _read_reply(self, timing=None):
+        """
+        Reads lines from the Lirc server until a complete reply packet
+        has been parsed. Returns the (completed) ReplyParser.
+        Button events received before the reply are buffered.
+        If timing (a CommandTiming) is given, its first_byte and
+        bytes_received are filled in.
+        """
+        parser = FastReplyParser(self._events)
+        while not parser.is_completed:
+            if not self._reader.has_line:
+                self._apply_deadline()
+                if not self._reader.fill(self._socket):
+                    raise socket.error(
+                        "Connection closed by the Lirc server")
+            lines = self._reader.feed_parser(parser)
+            if self._tracer is not None:
+                self._tracer.received(lines)
+            if timing is not None:
+                if timing.first_byte is None:
+                    timing.first_byte = _now()
+                timing.bytes_received += sum(len(line) + 1
+                                             for line in lines)
+        if parser.sighup:
+            self._on_sighup()
+        return parser
+
+    def _on_sighup(self):
+        """Called when lircd has announced a SIGHUP (reload of its config)."""
+        self._transmitters = None
+        if self._catalog is not None:
+            self._catalog.invalidate()
+
+    def _poll_broadcasts(self, timeout=0):
+        """
+        Reads the input that the Lirc server has sent between replies,
+        waiting at most timeout seconds (forever if None) for it, and
+        processes the SIGHUP packets and button events therein.
+        Only complete lines are consumed.
+        """
+        if self._socket is None:
+            self.reconnect()
+        while select.select([self._socket], [], [], timeout)[0]:
+            if not self._reader.fill(self._socket):
+                raise socket.error("Connection closed by the Lirc server")
+            timeout = 0
+        parser = self._broadcast_parser
+        lines = self._reader.pop_lines()
+        if self._tracer is not None:
+            self._tracer.received(lines)
+        for line in lines:
+            parser.feed(line)
+        if parser.sighup:
+            parser.sighup = False
+            self._on_sighup()
+        if parser.is_completed:
+            self._broadcast_parser = FastReplyParser(self._events)
+
+    def _poll_before_command(self):
+        """
+        _poll_broadcasts, before answering from what is remembered about
+        the Lirc server. With a retry policy, a connection error closes
+        the connection, to be reopened by the next command, and forgets
+        what is remembered, since the server may have been restarted.
+        """
+        try:
+            self._poll_broadcasts()
+        except CONNECTION_ERRORS:
+            if self._retry_policy is None:
+                raise
+            if self._socket is not None:
+                self._socket.close()
+                self._socket = None
+            self._on_sighup()
+
+    def events(self, timeout=None):
+        """
+        Generator yielding the button events (as IrEvent) broadcast by
+        the Lirc server. Between the events, commands may be sent over
+        the same connection; events arriving meanwhile are buffered.
+        If timeout is not None, the generator ends after timeout seconds
+        without events.
+        """
+        deadline = None
+        while True:
+            while self._events:
+                event = parse_event(self._events.popleft())
+                if event is not None:
+                    deadline = None
+                    yield event
+            if timeout is None:
+                self._poll_broadcasts(None)
+                continue
+            now = _now()
+            if deadline is None:
+                deadline = now + timeout
+            elif now >= deadline:
+                return
+            self._poll_broadcasts(deadline - now)
 
     # This function should preferrably not be made public, although
     # it may be tempting...
@@ -122,32 +324,242 @@ class AbstractLirconian:
         and receives zero or more lines in response.
         Returns a list of those lines.
         """
-        if self._verbose:
-            print("Sending: `" + packet
-                  + "' to Lirc@" + self._socket.__str__())
-
-        self._send_string(packet + '\n')
-        parser = ReplyParser()
-
-        while not parser.is_completed:
-            string = self._read_line()
-            if self._verbose:
-                print('Received: "{0}"'.format(string or ''))
-            if not string:
-                continue
-            parser.feed(string)
+        if self._scheduler is not None:
+            with self._scheduler.admission([packet]):
+                return self._send_command_unscheduled(packet)
+        return self._send_command_unscheduled(packet)
+
+    def _send_command_unscheduled(self, packet):
+        """_send_command without the scheduler."""
+        if self._retry_policy is None and self._deadline is None:
+            return self._send_command_once(packet)
+        return self._retrying([packet],
+                              lambda: self._send_command_once(packet))
+
+    def _send_command_once(self, packet):
+        """_send_command without retries."""
+        if self._tracer is not None:
+            self._tracer.sent([packet], self._socket)
+
+        if self._timing_hooks:
+            parser = self._send_timed([packet])[0]
+        else:
+            self._send_string(packet + '\n')
+            parser = self._read_reply()
         if not parser.success:
             raise LircServerException(''.join(parser.data))
         return parser.data
 
-    def send_ir_command(self, remote, command, count):
+    def _send_commands(self, packets):
+        """
+        Pipelined version of _send_command: sends all the packets in
+        the argument in one write, and then reads the replies. Since
+        lircd answers in order, the replies are matched to the requests
+        using the command echoed in each reply.
+        Returns a list of completed ReplyParsers, one per packet;
+        it is up to the caller to check their success.
+        """
+        if self._scheduler is not None:
+            with self._scheduler.admission(packets):
+                return self._send_commands_unscheduled(packets)
+        return self._send_commands_unscheduled(packets)
+
+    def _send_commands_unscheduled(self, packets):
+        """_send_commands without the scheduler."""
+        if self._retry_policy is None and self._deadline is None:
+            return self._send_commands_once(packets)
+        return self._retrying(packets,
+                              lambda: self._send_commands_once(packets))
+
+    def _send_commands_once(self, packets):
+        """_send_commands without retries."""
+        if self._tracer is not None:
+            self._tracer.sent(packets, self._socket)
+
+        if self._timing_hooks:
+            return self._send_timed(packets)
+        self._send_string(''.join([packet + '\n' for packet in packets]))
+        return [self._check_echo(self._read_reply(), packet)
+                for packet in packets]
+
+    def _retrying(self, packets, function):
+        """
+        Calls function, sending packets, with the retry policy and the
+        deadline applied. Returns the result of function.
+        """
+        policy = self._retry_policy
+        deadline = None if self._deadline is None \
+            else _now() + self._deadline
+        attempt = 0
+        try:
+            while True:
+                attempt += 1
+                if deadline is not None and deadline <= _now():
+                    raise socket.timeout(
+                        "Deadline of {0}s exceeded".format(self._deadline))
+                try:
+                    if self._socket is None:
+                        self.reconnect()
+                    # Applied before every send and receive.
+                    self._expires = deadline
+                    return function()
+                except CONNECTION_ERRORS:
+                    if policy is None:
+                        raise
+                    # The state of the connection is unknown; start over.
+                    if self._socket is not None:
+                        self._socket.close()
+                        self._socket = None
+                    if attempt >= policy.max_attempts \
+                            or not policy.retryable(packets):
+                        raise
+                    delay = policy.delay(attempt)
+                    if deadline is not None and _now() + delay >= deadline:
+                        raise
+                    time.sleep(delay)
+        finally:
+            self._expires = None
+            if deadline is not None and self._socket is not None:
+                self._socket.settimeout(self._timeout)
+
+    @staticmethod
+    def _check_echo(parser, packet):
+        """Returns the parser, if it holds the reply to packet."""
+        if parser.command != packet.strip():
+            raise BadPacketException(
+                "Reply to `{0}' received, expected reply to `{1}'"
+                .format(parser.command, packet))
+        return parser
+
+    def _send_timed(self, packets):
+        """
+        Version of _send_commands measuring every packet, and passing its
+        CommandTiming to the timing hooks, also if the command fails.
+        """
+        from .metrics import CommandTiming
+
+        started = _now()
+        timings = [CommandTiming(packet, started) for packet in packets]
+        parsers = []
+        try:
+            self._send_string(''.join([packet + '\n' for packet in packets]))
+            for packet, timing in zip(packets, timings):
+                parser = self._check_echo(self._read_reply(timing), packet)
+                timing.completed = _now()
+                timing.status = 'SUCCESS' if parser.success else 'ERROR'
+                parsers.append(parser)
+        except Exception as ex:
+            failed = _now()
+            for timing in timings[len(parsers):]:
+                timing.completed = failed
+                timing.status = type(ex).__name__
+            raise
+        finally:
+            for timing in timings:
+                for hook in self._timing_hooks:
+                    hook(timing)
+        return parsers
+
+    def add_timing_hook(self, hook):
+        """
+        Registers a callable, called with a metrics.CommandTiming after
+        every command sent to the Lirc server, for example a
+        metrics.LatencyMetrics.
+        """
+        self._timing_hooks.append(hook)
+
+    def remove_timing_hook(self, hook):
+        """Unregisters a hook registered by add_timing_hook."""
+        self._timing_hooks.remove(hook)
+
+    @staticmethod
+    def _send_once_packet(remote, command, count):
+        """Returns the SEND_ONCE packet for the arguments."""
+        return "SEND_ONCE " + remote + " " + command + " " + str(count - 1)
+
+    def send_ir_command(self, remote, command, count, transmitters=None):
         """
         Requests the Lirc server to transmit the named commmand,
         belonging to the named remote, the stated number of times.
         (The number of repeats in the sense of lircd(8) will be one less.)
+        If transmitters (a list of transmitter numbers) is given, they are
+        selected first, unless they already are; see set_transmitters.
         """
-        self._send_command(
-            "SEND_ONCE " + remote + " " + command + " " + str(count - 1))
+        if transmitters is not None:
+            self.set_transmitters(transmitters)
+        self._send_command(self._send_once_packet(remote, command, count))
+
+    def send_ir_command_sequence(self, sequence):
+        """
+        Transmits a sequence of commands, given as an iterable of
+        (remote, command, count) tuples, using one round trip to the Lirc
+        server instead of one per command. All commands are sent, even if
+        the Lirc server rejects some of them; in that case,
+        a LircServerException for the first failing one is thrown
+        after all replies have been received.
+        """
+        for error in self.send_ir_command_batch(sequence):
+            if error is not None:
+                raise error
+
+    def send_ir_commands(self, remote, commands, count=1):
+        """
+        Transmits several commands of one remote, like irsend does
+        with several command arguments, each count times.
+        The packets are written at once; see send_ir_command_sequence.
+        """
+        self.send_ir_command_sequence(
+            [(remote, command, count) for command in commands])
+
+    def send_ir_command_batch(self, sequence):
+        """
+        Transmits a sequence of (remote, command, count) tuples, of any
+        remotes, writing all packets at once. Instead of throwing,
+        returns the outcome of each command, in order: None on success,
+        otherwise a LircServerException.
+
+        A tuple may have a fourth element, the list of transmitters to
+        use (None for the current ones). The commands are then grouped by
+        transmitters: first those for the current transmitters, then the
+        others, in the order of first appearance, so that each change of
+        the transmitters costs one round trip per batch. Within a group,
+        the order is kept. If the Lirc server refuses a change, the
+        commands of that group are not sent, and their outcome is the
+        LircServerException.
+        """
+        sequence = [(item[0], item[1], item[2],
+                     None if len(item) < 4 or item[3] is None
+                     else self._transmitters_mask(item[3]))
+                    for item in sequence]
+        current = self._transmitters
+        groups = {}
+        order = []
+        for i, (_, _, _, mask) in enumerate(sequence):
+            key = current if mask is None else mask
+            if key not in groups:
+                groups[key] = []
+                order.append(key)
+            groups[key].append(i)
+        if current in groups and order[0] != current:
+            order.remove(current)
+            order.insert(0, current)
+
+        outcomes = [None] * len(sequence)
+        for key in order:
+            indices = groups[key]
+            if key is not None:
+                try:
+                    self.set_transmitters_mask(key)
+                except LircServerException as ex:
+                    for i in indices:
+                        outcomes[i] = ex
+                    continue
+            parsers = self._send_commands(
+                [self._send_once_packet(*sequence[i][:3]) for i in indices])
+            for i, parser in zip(indices, parsers):
+                if not parser.success:
+                    outcomes[i] = LircServerException(''.join(parser.data))
+        return outcomes
 
     def send_ir_command_repeat(self, remote, command):
         """
@@ -155,29 +567,104 @@ class AbstractLirconian:
         the named remote,
         until either explicitly stopped by a corresponding stop_ir command,
         or a server-specific limit is reached.
+        See lease_repeat for a repeat that is guaranteed to be stopped.
         """
-        self._last_remote = remote
-        self._last_command = command
+        self._last_repeat = (remote, command)
         self._send_command("SEND_START " + remote + " " + command)
+        with self._repeats_lock:
+            self._repeats.pop((remote, command), None)
+            self._repeats[(remote, command)] = None
+
+    def lease_repeat(self, remote, command, duration=None):
+        """
+        Starts transmitting the named command, like
+        send_ir_command_repeat, and returns a lease.RepeatLease; the
+        repeat is stopped when the lease is stopped or used as context
+        manager and its block left, after duration seconds (if not None),
+        or at interpreter exit, whatever comes first.
+        """
+        from .lease import RepeatLease
+
+        self.send_ir_command_repeat(remote, command)
+        lease = RepeatLease(self, remote, command, duration)
+        with self._repeats_lock:
+            self._repeats[(remote, command)] = lease
+        return lease
+
+    def active_repeats(self):
+        """
+        Returns a list of the (remote, command) pairs started on this
+        connection and not yet stopped, oldest first.
+        """
+        with self._repeats_lock:
+            return list(self._repeats)
 
     def stop_ir(self, remote=None, command=None):
         """
         Requests the Lirc server to stop transmitting the named command from
         the named remote. If and only if the start_ir_command_repeat
         has been previously used, the remote and command values can
-        be left out, in which case the old values are used.
+        be left out, in which case the latest started command still
+        repeating (or else the latest started) is used.
+        If the connection fails, SEND_STOP is sent over a new one; the
+        error is thrown only if that fails too.
+        """
+        with self._repeats_lock:
+            default = next(reversed(self._repeats)) if self._repeats \
+                else self._last_repeat
+        remote = remote or default[0]
+        command = command or default[1]
+        try:
+            self._send_command("SEND_STOP " + remote + " " + command)
+        except CONNECTION_ERRORS:
+            # Otherwise lircd would keep transmitting.
+            if not self._stop_out_of_band(remote, command):
+                raise
+        finally:
+            with self._repeats_lock:
+                lease = self._repeats.pop((remote, command), None)
+            if lease is not None:
+                lease._end('stop')
+
+    def _stop_out_of_band(self, remote, command):
         """
-        self._send_command(
-            "SEND_STOP "
-            + (remote if remote else self._last_remote)
-            + " " + (command if command else self._last_command))
+        Sends SEND_STOP over a new connection of its own, for use from
+        other threads. Returns True if the Lirc server acknowledged it;
+        errors are ignored.
+        """
+        with self._repeats_lock:
+            self._repeats.pop((remote, command), None)
+        try:
+            sock = self._new_socket()
+        except socket.error:
+            return False
+        try:
+            packet = "SEND_STOP " + remote + " " + command
+            if self._tracer is not None:
+                self._tracer.sent([packet], sock)
+            sock.sendall((packet + '\n').encode('US-ASCII'))
+            reader = LineReader(256)
+            parser = FastReplyParser()
+            while not parser.is_completed:
+                parser.feed(reader.readline(sock))
+            return parser.success
+        except (socket.error, BadPacketException):
+            return False
+        finally:
+            sock.close()
 
     def get_remotes(self):
         """
         Returns a list of the names of the remotes known
         to the Lirc server.
         """
-        return self._send_command("LIST")
+        if self._code_database is not None:
+            return self._code_database.get_remotes()
+        if self._catalog is None:
+            return self._send_command("LIST")
+        self._poll_before_command()
+        return list(self._catalog.fetch(
+            None, lambda: self._send_command("LIST")))
 
     def get_commands(self, remote, include_codes=False):
         """
@@ -187,14 +674,110 @@ class AbstractLirconian:
         the hexadecimal codes of
         the commands are also given, like irsend does.
         """
-        raw = self._send_command("LIST " + remote)
-        if include_codes:
-            return raw
+        if self._code_database is not None:
+            return self._code_database.get_commands(remote, include_codes)
+        if self._catalog is None:
+            raw = self._send_command("LIST " + remote)
+        else:
+            self._poll_before_command()
+            raw = list(self._catalog.fetch(
+                remote, lambda: self._send_command("LIST " + remote)))
+        return raw if include_codes else self._strip_codes(raw)
+
+    def enable_catalog_cache(self, ttl=None):
+        """
+        Have the results of get_remotes and get_commands cached.
+        The cache is invalidated when the Lirc server announces a SIGHUP,
+        after ttl seconds (if not None), or by calling refresh_catalog.
+        """
+        self._catalog = Catalog(ttl)
+
+    def disable_catalog_cache(self):
+        """Turns off the caching of get_remotes and get_commands."""
+        self._catalog = None
+
+    def command_index(self, remote):
+        """
+        Returns a names.CommandIndex of the commands of the remote, for
+        resolving approximate command names. With the catalog cache or
+        a code database, the index is memoized until the catalog is
+        invalidated or expires.
+        """
+        from .names import CommandIndex
+
+        if self._code_database is not None:
+            version, ttl = self._code_database, None
+        elif self._catalog is not None:
+            self._poll_before_command()
+            version, ttl = self._catalog.generation, self._catalog.ttl
+        else:
+            return CommandIndex(self.get_commands(remote))
+        memo = self._command_indexes.get(remote)
+        if memo is not None and memo[0] == version \
+                and (ttl is None or _now() - memo[1] < ttl):
+            return memo[2]
+        index = CommandIndex(self.get_commands(remote))
+        self._command_indexes[remote] = (version, _now(), index)
+        return index
+
+    def set_code_database(self, database):
+        """
+        Have get_remotes, get_commands, has_remote, and has_command
+        answered from a lircd_conf.CodeDatabase, read from the lircd.conf
+        files, instead of by the Lirc server. None turns this off.
+        """
+        self._code_database = database
+
+    def refresh_catalog(self):
+        """Drops the cached results of get_remotes and get_commands."""
+        if self._catalog is not None:
+            self._catalog.invalidate()
+
+    def has_remote(self, remote):
+        """
+        Returns True if the Lirc server knows the remote.
+        With the catalog cache enabled, this normally requires
+        no communication with the Lirc server.
+        """
+        if self._code_database is not None:
+            return self._code_database.has_remote(remote)
+        return remote in self.get_remotes()
+
+    def has_command(self, remote, command):
+        """
+        Returns True if the Lirc server knows the command of the remote.
+        With the catalog cache enabled, this normally requires
+        no communication with the Lirc server.
+        """
+        if self._code_database is not None:
+            return self._code_database.has_command(remote, command)
+        if not self.has_remote(remote):
+            return False
+        return command in self.get_commands(remote)
+
+    @staticmethod
+    def _strip_codes(raw):
+        """
+        Removes the leading hexadecimal codes from a LIST remote reply,
+        i.e. the equivalent of re.sub(r'^[0-9a-fA-F]* +', '', cmd).
+        """
         result = []
         for cmd in raw:
-            result.append(re.sub(r'^[0-9a-fA-F]* +', '', cmd))
+            code, space, name = cmd.partition(' ')
+            result.append(name.lstrip(' ')
+                          if space and not code.strip(_HEX_DIGITS) else cmd)
         return result
 
+    @staticmethod
+    def _transmitters_mask(transmitters):
+        """
+        Returns the SET_TRANSMITTERS mask for a list of transmitter numbers.
+        """
+        mask = 0
+        for transmitter in transmitters:
+            mask |= (1 << (int(transmitter) - 1))
+        return mask
+
     def set_transmitters(self, transmitters):
         """
         Requests the Lirc server to use the given transmitters for
@@ -207,10 +790,7 @@ class AbstractLirconian:
         Note that error messages from Lircd are not always reliable.
         If the Lirc server gives an error, a LircServerException is thrown.
         """
-        mask = 0
-        for transmitter in transmitters:
-            mask |= (1 << (int(transmitter) - 1))
-        self.set_transmitters_mask(mask)
+        self.set_transmitters_mask(self._transmitters_mask(transmitters))
 
     def set_transmitters_mask(self, mask):
         """
@@ -225,8 +805,26 @@ class AbstractLirconian:
         Note that error messages from Lircd are not always reliable.
         If the Lirc server gives an error,
         a LircServerException is thrown.
+
+        The last mask acknowledged by the Lirc server is remembered, and
+        setting it again is a no-op, until the connection is reopened or
+        lircd announces a SIGHUP. (Since lircd has only one setting for
+        all its clients, call forget_transmitters if others change it.)
         """
+        if mask == self._transmitters:
+            self._poll_before_command()
+            if mask == self._transmitters:
+                return
+        self._transmitters = None
         self._send_command("SET_TRANSMITTERS " + str(mask))
+        self._transmitters = mask
+
+    def forget_transmitters(self):
+        """
+        Forgets the transmitters last set, so that the next
+        set_transmitters is sent to the Lirc server in any case.
+        """
+        self._transmitters = None
 
     def get_version(self):
         """Returns the version string of the Lirc server."""
@@ -250,15 +848,34 @@ class AbstractLirconian:
         self._send_command("SIMULATE " + event_string)
 
     def set_verbose(self, verbose):
-        """Sets the verbosity of the instance."""
+        """
+        Sets the verbosity of the instance. If verbose, the communication
+        with the Lirc server is logged, with level DEBUG, to the logger
+        lirconian.protocol (see lirconian.trace).
+        """
         self._verbose = verbose
+        if verbose or self._tracer is not None:
+            from .trace import configure
+            self._tracer = configure(self._tracer, verbose=verbose)
+
+    def set_capture(self, capture):
+        """
+        Records all the communication with the Lirc server in capture,
+        a path name or a writable text file, as JSON lines
+        (see lirconian.trace); None stops the recording.
+        """
+        if capture is not None or self._tracer is not None:
+            from .trace import configure
+            self._tracer = configure(self._tracer, capture=capture)
 
     def set_timeout(self, timeout):
         """
         Sets the timeout of the socket to the value of the argument.
          Unit is seconds.
          """
-        self._socket.settimeout(timeout)
+        self._timeout = timeout
+        if self._socket is not None:
+            self._socket.settimeout(timeout)
 
 
 class UnixDomainSocketLirconian(AbstractLirconian):
@@ -267,11 +884,22 @@ class UnixDomainSocketLirconian(AbstractLirconian):
     typically /var/run/lirc/lircd.
     """
     def __init__(self, socketAddress=DEFAULT_LIRC_DEVICE,
-                 verbose=False, timeout=None):
-        AbstractLirconian.__init__(self, verbose)
-        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-        self.set_timeout(timeout)
-        self._socket.connect(socketAddress)
+                 verbose=False, timeout=None,
+                 chunk_size=DEFAULT_CHUNK_SIZE):
+        AbstractLirconian.__init__(self, verbose, chunk_size)
+        self._address = socketAddress
+        self._timeout = timeout
+        self._connect()
+
+    def _new_socket(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self._timeout)
+        try:
+            sock.connect(self._address)
+        except socket.error:
+            sock.close()
+            raise
+        return sock
 
 
 class TcpLirconian(AbstractLirconian):
@@ -281,210 +909,43 @@ class TcpLirconian(AbstractLirconian):
     """
 
     def __init__(self, address="localhost",
-                 port=DEFAULT_PORT, verbose=False, timeout=None):
-        AbstractLirconian.__init__(self, verbose)
-        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.set_timeout(timeout)
-        self._socket.connect((address, port))
+                 port=DEFAULT_PORT, verbose=False, timeout=None,
+                 chunk_size=DEFAULT_CHUNK_SIZE):
+        AbstractLirconian.__init__(self, verbose, chunk_size)
+        self._address = (address, port)
+        self._timeout = timeout
+        self._connect()
+
+    def _new_socket(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.settimeout(self._timeout)
+        try:
+            sock.connect(self._address)
+        except socket.error:
+            sock.close()
+            raise
+        return sock
+
+
+def parse_commandline(argv=None):
+    """ Parse command line args and options, returns a ArgumentParser. """
+    from .cli import parse_commandline as _parse_commandline
+    return _parse_commandline(argv)
 
 
-def _new_lirconian(command_line_args):
+def main():
     """
-    Factory method that returns a concrete subclass of the Lirconian,
-    depending on the argument.
+    Interface between the command line and the classes.
+    If a lirconian daemon is running, the command line is forwarded to it;
+    otherwise the command line interface in lirconian.cli is loaded.
     """
-    try:
-        return UnixDomainSocketLirconian(command_line_args.socket_pathname,
-                                         command_line_args.verbose,
-                                         command_line_args.timeout) \
-            if command_line_args.address is None else \
-            TcpLirconian(command_line_args.address,
-                         command_line_args.port,
-                         command_line_args.verbose,
-                         command_line_args.timeout)
-    except Exception as ex:
-        raise ClientInstantiationError(ex)
-
-
-def parse_commandline():
-    """ Parse command line args and options, returns a ArgumentParser. """
-    parser = argparse.ArgumentParser(
-        prog='lirconian',
-        description="Program to send IR codes and commands to a Lirc server.")
-    parser.add_argument(
-        "-a", "--address",
-        help='IP name or address of lircd host. '
-        + 'Takes preference over --device.',
-        metavar='host', dest='address', default=None)
-    socket_path = os.environ['LIRC_SOCKET_PATH'] \
-        if 'LIRC_SOCKET_PATH' in os.environ else DEFAULT_LIRC_DEVICE
-    parser.add_argument(
-        '-d', '--device',
-        help='Path name of the lircd socket', metavar='path',
-        dest='socket_pathname', default=socket_path)
-    parser.add_argument(
-        '-p', '--port',
-        help='Port of lircd, default ' + str(DEFAULT_PORT), metavar='port',
-        dest='port', default=DEFAULT_PORT, type=int)
-    parser.add_argument(
-        '-t', '--timeout',
-        help='Timeout in seconds', metavar='s',
-        dest='timeout', type=int, default=None)
-    parser.add_argument(
-        '-V', '--version',
-        help='Display version information for this program',
-        action='version', version=VERSION)
-    parser.add_argument(
-        '-v', '--verbose',
-        help='Have the communication with the Lirc server echoed',
-        dest='verbose', action='store_true')
-
-    subparsers = \
-        parser.add_subparsers(dest='subcommand', metavar='sub-commands')
-
-    # Command send
-    parser_send_once = subparsers.add_parser(
-        'send',
-        help='Send one command')
-    parser_send_once.add_argument(
-        '-#', '-c', '--count',
-        help='Number of times to send command in send-once',
-        dest='count', type=int, default=1)
-    parser_send_once.add_argument('remote', help='Name of remote')
-    parser_send_once.add_argument('command', help='Name of command')
-
-    # Command start
-    parser_send_start = subparsers.add_parser(
-        'start',
-        help='Start sending one command until stopped')
-    parser_send_start.add_argument('remote', help='Name of remote')
-    parser_send_start.add_argument('command', help='Name of command')
-
-    # Command stop
-    parser_send_stop = subparsers.add_parser(
-        'stop',
-        help='Stop sending the command from send-start')
-    parser_send_stop.add_argument('remote', help='remote command')
-    parser_send_stop.add_argument('command', help='remote command')
-
-    # Command remotes
-    parser_list = subparsers.add_parser(
-        'remotes',
-        help='Inquire the list of remotes')
-
-    # Command commands
-    parser_list = subparsers.add_parser(
-        'commands',
-        help='Inquire the list of commands in a remote')
-    parser_list.add_argument(
-        "-c", "--codes",
-        help='List the numerical codes in lircd.conf, not only the names',
-        dest='codes', action='store_true')
-    parser_list.add_argument('remote', help='Name of remote')
-
-    # Command input_log
-    parser_set_input_log = subparsers.add_parser(
-        'input-log',
-        help='Set input logging')
-    parser_set_input_log.add_argument(
-        'log_file', nargs='?',
-        help='Path to log file, empty to inhibit logging', default='')
-
-    # Command set_driver_options
-    parser_set_driver_options = subparsers.add_parser(
-        'driver-option',
-        help='Set driver option')
-    parser_set_driver_options.add_argument('key', help='Name of the option')
-    parser_set_driver_options.add_argument('value', help='Option value')
-
-    # Command simulate
-    # The user must find out syntax & semantics of the even string himself ;-)
-    parser_simulate = subparsers.add_parser(
-        'simulate',
-        help='Fake the reception of IR signals')
-    parser_simulate.add_argument(
-        'event_string',
-        help='Event string to send to the Lirc server (ONE argument!)')
-
-    # Command set_transmitters
-    parser_set_transmitters = subparsers.add_parser(
-        'transmitters',
-        help='Set transmitters')
-    parser_set_transmitters.add_argument(
-        'transmitters', nargs='+',
-        help="transmitter...")
-
-    # Command version
-    subparsers.add_parser(
-        'version',
-        help='Inquire version of the Lirc server. '
-        + ' (Use "--version" for the version of this program.)')
-
-    return parser.parse_args()
+    from .daemon import forward
+    exitstatus = forward(sys.argv[1:])
+    if exitstatus is not None:
+        sys.exit(exitstatus)
 
-
-def main():
-    """Interface between the command line and the classes."""
-
-    def _print_list(iterable):
-        for line in iterable:
-            print(line)
-
-    commands = {
-        'send':
-            lambda: lirc.send_ir_command(args.remote, args.command,
-                                         args.count),
-        'start':
-            lambda: lirc.send_ir_command_repeat(args.remote, args.command),
-        'stop':
-            lambda: lirc.stop_ir(args.remote, args.command),
-        'remotes':
-            lambda: _print_list(lirc.get_remotes()),
-        'commands':
-            lambda: _print_list(lirc.get_commands(args.remote, args.codes)),
-        'driver-option':
-            lambda: lirc.set_driver_option(args.key, args.value),
-        'simulate':
-            lambda: lirc.simulate(args.event_string),
-        'transmitters':
-            lambda: lirc.set_transmitters(args.transmitters),
-        'input-log':
-            lambda: lirc.set_input_log(args.log_file),
-        'version':
-            lambda: print(lirc.get_version()),
-    }
-
-    args = parse_commandline()
-
-    lirc = None
-    try:
-        lirc = _new_lirconian(args)
-    except ClientInstantiationError as ex:
-        print("Cannot instantiate lirconian: {0}".format(ex))
-        sys.exit(2)
-
-    try:
-        exitstatus = 0
-        if args.subcommand in commands:
-            commands[args.subcommand]()
-        else:
-            print('Unknown or missing subcommand, use --help for syntax.')
-            exitstatus = 1
-
-    except LircServerException as ex:
-        print("LircServerError: {0}".format(ex))
-        exitstatus = 3
-    except BadPacketException as ex:
-        print("Malformed or unexpected package received: {0}".format(ex))
-        exitstatus = 4
-    except socket.timeout:
-        print("Timeout occured (was {0}s).".format(args.timeout))
-        exitstatus = 5
-
-    if lirc:
-        lirc.close()
-
-    sys.exit(exitstatus)
+    from .cli import main as cli_main
+    cli_main()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,428 @@
+# Copyright (C) 2017 Bengt Martensson.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see http://www.gnu.org/licenses/.
+
+"""
+Asyncio version of the Lirconian, for use inside an event loop.
+
+The API is the same as the one of AbstractLirconian, except that the
+methods are coroutines. Any number of tasks may use the same instance
+concurrently: requests are written as soon as they are issued, and the
+replies, which lircd sends in order, are dispatched to the waiting callers
+by a reader task. No threads are used.
+
+Button events broadcast by lircd are available through the async
+iterator events().
+
+Requires Python 3.6 or later.
+"""
+
+import asyncio
+import collections
+
+from . import AbstractLirconian, LircServerException, \
+    DEFAULT_LIRC_DEVICE, DEFAULT_PORT
+from .reply_parser import FastReplyParser, BadPacketException
+from .events import parse_event, EVENT_BUFFER_SIZE
+
+
+class AsyncAbstractLirconian(object):
+    """
+    Abstract base class for the asyncio Lirconian. To implement the class,
+    the coroutine _open_connection needs to be implemented,
+    returning a (StreamReader, StreamWriter) pair.
+    """
+
+    def __init__(self, verbose, timeout):
+        self._verbose = False
+        self._tracer = None
+        self._timeout = timeout
+        self._reader = None
+        self._writer = None
+        self._reader_task = None
+        self._connect_lock = None
+        self._transmitters_lock = None
+        self._pending = collections.deque()
+        self._event_queue = None
+        self._last_command = None
+        self._last_remote = None
+        self.set_verbose(verbose)
+
+    async def _open_connection(self):
+        raise NotImplementedError
+
+    async def connect(self):
+        """
+        Connects to the Lirc server. It is not necessary to call this
+        explicitly; the connection is opened by the first command.
+        """
+        if self._writer is not None:
+            return
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self._writer is None:
+                self._reader, self._writer = await self._open_connection()
+                self._reader_task = \
+                    asyncio.ensure_future(self._read_replies())
+
+    def close(self):
+        """Close the connection."""
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            self._reader_task = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        self._fail_pending(ConnectionError("Connection closed"))
+        self._end_events()
+        if self._tracer is not None:
+            self._tracer.close()
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *args):
+        self.close()
+
+    def _fail_pending(self, exception):
+        while self._pending:
+            future = self._pending.popleft()[1]
+            if not future.done():
+                future.set_exception(exception)
+
+    def _end_events(self):
+        if self._event_queue is not None:
+            self._put_event(None)
+
+    def _put_event(self, line):
+        if self._event_queue.full():
+            self._event_queue.get_nowait()
+        self._event_queue.put_nowait(line)
+
+    async def _read_replies(self):
+        """
+        Reader task: parses the replies from the Lirc server and hands
+        them to the callers waiting for them, in order. Button events
+        are handed to the events() iterator, if running.
+        """
+        events = []
+        try:
+            while True:
+                parser = FastReplyParser(events)
+                while not parser.is_completed:
+                    line = await self._reader.readline()
+                    if not line:
+                        raise ConnectionError("Connection closed by server")
+                    if self._tracer is not None:
+                        self._tracer.received([line.rstrip(b'\n')])
+                    parser.feed(line)
+                    if events:
+                        if self._event_queue is not None:
+                            for event in events:
+                                self._put_event(event)
+                        del events[:]
+                if not self._pending:
+                    raise BadPacketException(
+                        "Unexpected reply to `{0}' received"
+                        .format(parser.command))
+                packet, future = self._pending.popleft()
+                if parser.command != packet.strip():
+                    raise BadPacketException(
+                        "Reply to `{0}' received, expected reply to `{1}'"
+                        .format(parser.command, packet))
+                if not future.done():
+                    future.set_result(parser)
+        except asyncio.CancelledError:
+            raise
+        except Exception as ex:  # pylint: disable=broad-except
+            self._fail_pending(ex)
+            self._end_events()
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            self._reader_task = None
+
+    async def events(self):
+        """
+        Async iterator yielding the button events (as IrEvent) broadcast
+        by the Lirc server, until the connection is closed. Meanwhile,
+        commands may be sent over the same connection.
+        """
+        if self._event_queue is None:
+            self._event_queue = asyncio.Queue(EVENT_BUFFER_SIZE)
+        await self.connect()
+        while True:
+            line = await self._event_queue.get()
+            if line is None:
+                return
+            event = parse_event(line)
+            if event is not None:
+                yield event
+
+    async def _send_command(self, packet):
+        """
+        Sends its argument string to the Lirc server,
+        and waits for the reply.
+        Returns the list of the DATA lines in the reply.
+        """
+        parser = await self._wait_for(self._send_packet(packet))
+        if not parser.success:
+            raise LircServerException(''.join(parser.data))
+        return parser.data
+
+    async def _send_packet(self, packet):
+        """Sends a packet, returns the completed ReplyParser of its reply."""
+        await self.connect()
+        if self._tracer is not None:
+            self._tracer.sent([packet], self)
+        future = asyncio.get_event_loop().create_future()
+        self._pending.append((packet, future))
+        self._writer.write(bytearray(packet + '\n', 'US-ASCII'))
+        await self._writer.drain()
+        return await future
+
+    async def _wait_for(self, coroutine):
+        return await asyncio.wait_for(coroutine, self._timeout)
+
+    async def send_ir_command(self, remote, command, count,
+                              transmitters=None):
+        """
+        Requests the Lirc server to transmit the named commmand,
+        belonging to the named remote, the stated number of times.
+        (The number of repeats in the sense of lircd(8) will be one less.)
+        If transmitters (a list of transmitter numbers) is given, they are
+        selected first; no other task changes them in between.
+        """
+        packet = AbstractLirconian._send_once_packet(remote, command, count)
+        if transmitters is None:
+            await self._send_command(packet)
+            return
+        async with self._transmitters_guard():
+            await self._set_transmitters_mask(
+                AbstractLirconian._transmitters_mask(transmitters))
+            await self._send_command(packet)
+
+    async def send_ir_command_sequence(self, sequence):
+        """
+        Transmits a sequence of commands, given as an iterable of
+        (remote, command, count) or (remote, command, count, transmitters)
+        tuples. All packets (with the same transmitters) are written at once;
+        if the Lirc server rejects some of them, a LircServerException
+        for the first failing one is thrown.
+        """
+        for error in await self.send_ir_command_batch(sequence):
+            if error is not None:
+                raise error
+
+    async def send_ir_commands(self, remote, commands, count=1):
+        """Transmits several commands of one remote, each count times."""
+        await self.send_ir_command_sequence(
+            [(remote, command, count) for command in commands])
+
+    async def send_ir_command_batch(self, sequence):
+        """
+        Transmits a sequence of (remote, command, count) tuples, and
+        returns the outcome of each: None, or a LircServerException.
+        A tuple may have the transmitters (a list of transmitter numbers,
+        or None) as fourth element. The commands without transmitters are
+        sent first, then those of each set of transmitters, preceded by
+        selecting them; if that is refused, they are not sent, and their
+        outcome is the exception. (Unlike AbstractLirconian, the
+        transmitters are selected even if they already are.)
+        """
+        sequence = list(sequence)
+        outcomes = [None] * len(sequence)
+        groups = collections.OrderedDict()
+        for i, item in enumerate(sequence):
+            mask = None if len(item) < 4 or item[3] is None \
+                else AbstractLirconian._transmitters_mask(item[3])
+            groups.setdefault(mask, []).append(i)
+        for mask, indices in groups.items():
+            if mask is None:
+                await self._send_batch(sequence, indices, outcomes)
+                continue
+            async with self._transmitters_guard():
+                try:
+                    await self._set_transmitters_mask(mask)
+                except LircServerException as ex:
+                    for i in indices:
+                        outcomes[i] = ex
+                    continue
+                await self._send_batch(sequence, indices, outcomes)
+        return outcomes
+
+    async def _send_batch(self, sequence, indices, outcomes):
+        """Sends the commands of sequence at indices, pipelined."""
+        parsers = await self._wait_for(asyncio.gather(
+            *[self._send_packet(
+                AbstractLirconian._send_once_packet(*sequence[i][:3]))
+              for i in indices]))
+        for i, parser in zip(indices, parsers):
+            if not parser.success:
+                outcomes[i] = LircServerException(''.join(parser.data))
+
+    def _transmitters_guard(self):
+        """
+        Lock held while selecting transmitters and sending with them,
+        since the setting applies to all following transmissions.
+        """
+        if self._transmitters_lock is None:
+            self._transmitters_lock = asyncio.Lock()
+        return self._transmitters_lock
+
+    async def send_ir_command_repeat(self, remote, command):
+        """
+        Requests the Lirc server to start transmitting the named command from
+        the named remote,
+        until either explicitly stopped by a corresponding stop_ir command,
+        or a server-specific limit is reached.
+        """
+        self._last_remote = remote
+        self._last_command = command
+        await self._send_command("SEND_START " + remote + " " + command)
+
+    async def stop_ir(self, remote=None, command=None):
+        """
+        Requests the Lirc server to stop transmitting the named command from
+        the named remote. If and only if the start_ir_command_repeat
+        has been previously used, the remote and command values can
+        be left out, in which case the old values are used.
+        """
+        await self._send_command(
+            "SEND_STOP "
+            + (remote if remote else self._last_remote)
+            + " " + (command if command else self._last_command))
+
+    async def get_remotes(self):
+        """
+        Returns a list of the names of the remotes known
+        to the Lirc server.
+        """
+        return await self._send_command("LIST")
+
+    async def get_commands(self, remote, include_codes=False):
+        """
+        Returns a list of the commands contained in the remote
+        given as argument.
+        If the optional argument include_codes is True,
+        the hexadecimal codes of the commands are also given.
+        """
+        raw = await self._send_command("LIST " + remote)
+        return raw if include_codes else AbstractLirconian._strip_codes(raw)
+
+    async def set_transmitters(self, transmitters):
+        """
+        Requests the Lirc server to use the given transmitters for
+        future transmissions. The first transmitter has number 1.
+        """
+        await self.set_transmitters_mask(
+            AbstractLirconian._transmitters_mask(transmitters))
+
+    async def set_transmitters_mask(self, mask):
+        """
+        Requests the Lirc server to use the given transmitters by
+        the arguments for future transmissions.
+        The argument is an integer, were bit n is set if the n+1 transmitter
+        is to be enabled.
+        """
+        async with self._transmitters_guard():
+            await self._set_transmitters_mask(mask)
+
+    async def _set_transmitters_mask(self, mask):
+        await self._send_command("SET_TRANSMITTERS " + str(mask))
+
+    async def get_version(self):
+        """Returns the version string of the Lirc server."""
+        result = await self._send_command("VERSION")
+        return result[0]
+
+    async def set_input_log(self, path):
+        """Sets the input log path to lircd. If None. inhibit logging."""
+        await self._send_command("SET_INPUTLOG " + (path or ""))
+
+    async def set_driver_option(self, key, value):
+        """Sets a driver option to the given value."""
+        await self._send_command("DRV_OPTION " + key + " " + value)
+
+    async def simulate(self, event_string):
+        """
+        Sends the argument string uninterpreted to the Lirc server
+        for simulation.
+        """
+        await self._send_command("SIMULATE " + event_string)
+
+    def set_verbose(self, verbose):
+        """
+        Sets the verbosity of the instance; see
+        AbstractLirconian.set_verbose.
+        """
+        self._verbose = verbose
+        if verbose or self._tracer is not None:
+            from .trace import configure
+            self._tracer = configure(self._tracer, verbose=verbose)
+
+    def set_capture(self, capture):
+        """
+        Records the communication with the Lirc server; see
+        AbstractLirconian.set_capture.
+        """
+        if capture is not None or self._tracer is not None:
+            from .trace import configure
+            self._tracer = configure(self._tracer, capture=capture)
+
+    def set_timeout(self, timeout):
+        """
+        Sets the timeout of the requests to the value of the argument.
+        Unit is seconds, None for no timeout.
+        """
+        self._timeout = timeout
+
+
+class AsyncUnixDomainSocketLirconian(AsyncAbstractLirconian):
+    """
+    This class implements the asyncio Lirconian with a Unix Domain Socket,
+    typically /var/run/lirc/lircd.
+    """
+
+    def __init__(self, socketAddress=DEFAULT_LIRC_DEVICE,
+                 verbose=False, timeout=None):
+        AsyncAbstractLirconian.__init__(self, verbose, timeout)
+        self._socket_address = socketAddress
+
+    async def _open_connection(self):
+        return await asyncio.open_unix_connection(self._socket_address)
+
+    def __str__(self):
+        return self._socket_address
+
+
+class AsyncTcpLirconian(AsyncAbstractLirconian):
+    """
+    This class implements the asyncio Lirconian using a TCP network socket,
+    per default on port 8765.
+    """
+
+    def __init__(self, address="localhost",
+                 port=DEFAULT_PORT, verbose=False, timeout=None):
+        AsyncAbstractLirconian.__init__(self, verbose, timeout)
+        self._address = address
+        self._port = port
+
+    async def _open_connection(self):
+        return await asyncio.open_connection(self._address, self._port)
+
+    def __str__(self):
+        return "{0}:{1}".format(self._address, self._port)
@@ -0,0 +1,57 @@
+# Copyright (C) 2017 Bengt Martensson.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see http://www.gnu.org/licenses/.
+
+"""
+Cache for the results of the LIST commands of a Lirc server.
+"""
+
+import time
+
+_now = getattr(time, 'monotonic', time.time)
+
+
+class Catalog(object):
+    """
+    Caches the remotes known to a Lirc server, and the commands
+    (including their codes) of each remote.
+    Entries expire after ttl seconds (never if None), or when
+    invalidate() is called, typically after lircd has sent a SIGHUP.
+    The generation is incremented at each invalidation, allowing
+    derived data to be memoized.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self.generation = 0
+        self._entries = {}
+
+    def invalidate(self):
+        """Drop all entries."""
+        self._entries.clear()
+        self.generation += 1
+
+    def fetch(self, key, loader):
+        """
+        Returns the cached value for key, calling loader() to (re-)load it
+        if missing or expired.
+        Key is None for the list of remotes, otherwise the name of a remote.
+        """
+        entry = self._entries.get(key)
+        if entry is not None and \
+                (self.ttl is None or _now() - entry[1] < self.ttl):
+            return entry[0]
+        value = loader()
+        self._entries[key] = (value, _now())
+        return value
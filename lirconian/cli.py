@@ -0,0 +1,624 @@
+# Copyright (C) 2017 Bengt Martensson.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see http://www.gnu.org/licenses/.
+
+"""
+The command line interface of the Lirconian.
+
+It is kept out of the lirconian package proper, so that users of the API
+do not pay for importing argparse. Only the arguments of the sub-command
+actually given are set up.
+"""
+
+from __future__ import print_function
+import argparse
+import os
+import socket
+import sys
+
+from . import VERSION, DEFAULT_LIRC_DEVICE, DEFAULT_PORT, \
+    UnixDomainSocketLirconian, TcpLirconian, LircServerException, \
+    ClientInstantiationError
+from .reply_parser import BadPacketException
+
+
+def _new_lirconian(command_line_args):
+    """
+    Factory method that returns a concrete subclass of the Lirconian,
+    depending on the argument. If several addresses are given,
+    a MultiLirconian is returned.
+    """
+    addresses = command_line_args.address
+    try:
+        if addresses and len(addresses) > 1:
+            from .fanout import MultiLirconian
+            return MultiLirconian(addresses,
+                                  command_line_args.port,
+                                  command_line_args.verbose,
+                                  command_line_args.timeout)
+        return UnixDomainSocketLirconian(command_line_args.socket_pathname,
+                                         command_line_args.verbose,
+                                         command_line_args.timeout) \
+            if not addresses else \
+            TcpLirconian(addresses[0],
+                         command_line_args.port,
+                         command_line_args.verbose,
+                         command_line_args.timeout)
+    except Exception as ex:
+        raise ClientInstantiationError(ex)
+
+
+def parse_commandline(argv=None):
+    """ Parse command line args and options, returns a ArgumentParser. """
+    argv = sys.argv[1:] if argv is None else argv
+    return _build_parser(argv).parse_args(argv)
+
+
+# Global options taking a value.
+_VALUE_OPTIONS = ['-a', '--address', '-d', '--device', '-p', '--port',
+                  '-t', '--timeout', '--capture', '--config']
+
+
+def _find_subcommand(argv):
+    """
+    Returns the name of the sub-command in argv,
+    or None if there is none, or help is requested.
+    """
+    names = set(name for name, _, _ in _SUBCOMMANDS)
+    tokens = iter(argv)
+    for token in tokens:
+        if token in ('-h', '--help'):
+            return None
+        if token in _VALUE_OPTIONS \
+                or (token.startswith('--') and '=' not in token
+                    and len(token) > 2
+                    and any(option.startswith(token)
+                            for option in _VALUE_OPTIONS)):
+            next(tokens, None)
+        elif not token.startswith('-'):
+            return token if token in names else None
+    return None
+
+
+def _build_parser(argv=None, parser_class=None, environ=None):
+    """
+    Returns the ArgumentParser for the command line. If argv is given,
+    only the arguments of the sub-command therein are set up.
+    The defaults are taken from environ, default os.environ.
+    """
+    environ = os.environ if environ is None else environ
+    parser = (parser_class or argparse.ArgumentParser)(
+        prog='lirconian',
+        description="Program to send IR codes and commands to a Lirc server.")
+    parser.add_argument(
+        "-a", "--address",
+        help='IP name or address of lircd host. '
+        + 'Takes preference over --device. '
+        + 'May be given several times, to send to several hosts.',
+        metavar='host', dest='address', action='append', default=None)
+    socket_path = environ['LIRC_SOCKET_PATH'] \
+        if 'LIRC_SOCKET_PATH' in environ else DEFAULT_LIRC_DEVICE
+    parser.add_argument(
+        '-d', '--device',
+        help='Path name of the lircd socket', metavar='path',
+        dest='socket_pathname', default=socket_path)
+    parser.add_argument(
+        '-p', '--port',
+        help='Port of lircd, default ' + str(DEFAULT_PORT), metavar='port',
+        dest='port', default=DEFAULT_PORT, type=int)
+    parser.add_argument(
+        '-t', '--timeout',
+        help='Timeout in seconds', metavar='s',
+        dest='timeout', type=int, default=None)
+    parser.add_argument(
+        '-V', '--version',
+        help='Display version information for this program',
+        action='version', version=VERSION)
+    parser.add_argument(
+        '-v', '--verbose',
+        help='Have the communication with the Lirc server echoed',
+        dest='verbose', action='store_true')
+    parser.add_argument(
+        '--config',
+        help='lircd.conf file or directory; the remotes and commands are '
+        + 'taken from there instead of from the Lirc server',
+        metavar='path', dest='config', default=None)
+    parser.add_argument(
+        '--capture',
+        help='Record the communication with the Lirc server in a file '
+        + '(JSON lines), for lirconian.replay',
+        metavar='path', dest='capture', default=None)
+    parser.add_argument(
+        '--timing',
+        help='Print latency statistics per Lirc command on stderr',
+        dest='timing', action='store_true')
+
+    subparsers = \
+        parser.add_subparsers(dest='subcommand', metavar='sub-commands')
+
+    subcommand = None if argv is None else _find_subcommand(argv)
+    for name, help_text, add_arguments in _SUBCOMMANDS:
+        subparser = subparsers.add_parser(name, help=help_text)
+        if add_arguments and subcommand in (None, name):
+            add_arguments(subparser)
+
+    return parser
+
+
+def _add_send_arguments(parser_send_once):
+    parser_send_once.add_argument(
+        '-#', '-c', '--count',
+        help='Number of times to send command in send-once',
+        dest='count', type=int, default=1)
+    parser_send_once.add_argument('remote', help='Name of remote')
+    parser_send_once.add_argument('command', nargs='+',
+                                  help='Name of command(s)')
+
+
+def _add_start_arguments(parser_send_start):
+    parser_send_start.add_argument('remote', help='Name of remote')
+    parser_send_start.add_argument('command', help='Name of command')
+
+
+def _add_stop_arguments(parser_send_stop):
+    parser_send_stop.add_argument('remote', help='remote command')
+    parser_send_stop.add_argument('command', help='remote command')
+
+
+def _add_commands_arguments(parser_list):
+    parser_list.add_argument(
+        "-c", "--codes",
+        help='List the numerical codes in lircd.conf, not only the names',
+        dest='codes', action='store_true')
+    parser_list.add_argument('remote', help='Name of remote')
+
+
+def _add_input_log_arguments(parser_set_input_log):
+    parser_set_input_log.add_argument(
+        'log_file', nargs='?',
+        help='Path to log file, empty to inhibit logging', default='')
+
+
+def _add_driver_option_arguments(parser_set_driver_options):
+    parser_set_driver_options.add_argument('key', help='Name of the option')
+    parser_set_driver_options.add_argument('value', help='Option value')
+
+
+# The user must find out syntax & semantics of the even string himself ;-)
+def _add_simulate_arguments(parser_simulate):
+    parser_simulate.add_argument(
+        'event_string',
+        help='Event string to send to the Lirc server (ONE argument!)')
+
+
+def _add_transmitters_arguments(parser_set_transmitters):
+    parser_set_transmitters.add_argument(
+        'transmitters', nargs='+',
+        help="transmitter...")
+
+
+def _add_batch_arguments(parser_batch):
+    parser_batch.add_argument(
+        '-d', '--delay',
+        help='Delay in seconds between the lines, default 0',
+        metavar='s', dest='delay', type=float, default=0)
+    parser_batch.add_argument(
+        '-e', '--stop-on-error',
+        help='Stop at the first failing line',
+        dest='stop_on_error', action='store_true')
+    parser_batch.add_argument(
+        'batch_file', nargs='?', default='-',
+        help='File with sub-commands, "-" (default) for stdin')
+
+
+def _add_macro_arguments(parser_macro):
+    parser_macro.add_argument(
+        '-f', '--file',
+        help='File with the macro, "-" for stdin', metavar='path',
+        dest='macro_file', default=None)
+    parser_macro.add_argument(
+        '-r', '--remote',
+        help='Remote of keys without remote: prefix', metavar='remote',
+        dest='remote', default=None)
+    parser_macro.add_argument(
+        '-g', '--gap',
+        help='Default gap after each key, like 300ms or 0.3s, default 0',
+        metavar='duration', dest='gap', default='0')
+    parser_macro.add_argument(
+        '-n', '--no-validate',
+        help='Do not check the names against the Lirc server first',
+        dest='validate', action='store_false')
+    parser_macro.add_argument(
+        'steps', nargs='*',
+        help='Macro lines, like "KEY_1" or "KEY_VOLUMEUP hold=1s", '
+        + 'executed after the file')
+
+
+def _add_daemon_arguments(parser_daemon):
+    parser_daemon.add_argument(
+        '-s', '--socket',
+        help='Path name of the daemon socket', metavar='path',
+        dest='daemon_socket', default=None)
+
+
+def _add_serve_arguments(parser_serve):
+    parser_serve.add_argument(
+        '-l', '--listen',
+        help='Address to listen on, default 127.0.0.1', metavar='host',
+        dest='listen', default='127.0.0.1')
+    parser_serve.add_argument(
+        '-P', '--http-port',
+        help='HTTP port to listen on, default 8080', metavar='port',
+        dest='http_port', type=int, default=8080)
+    parser_serve.add_argument(
+        '-n', '--connections',
+        help='Maximal number of connections to the Lirc server, default 4',
+        metavar='n', dest='connections', type=int, default=4)
+    parser_serve.add_argument(
+        '-r', '--rate',
+        help='Maximal number of transmissions per second, default no limit',
+        metavar='n', dest='rate', type=float, default=None)
+
+
+# Name, help text, and function setting up the arguments
+# (None if there are none) of the sub-commands.
+_SUBCOMMANDS = [
+    ('send', 'Send one or more commands', _add_send_arguments),
+    ('start', 'Start sending one command until stopped',
+     _add_start_arguments),
+    ('stop', 'Stop sending the command from send-start',
+     _add_stop_arguments),
+    ('remotes', 'Inquire the list of remotes', None),
+    ('commands', 'Inquire the list of commands in a remote',
+     _add_commands_arguments),
+    ('input-log', 'Set input logging', _add_input_log_arguments),
+    ('driver-option', 'Set driver option', _add_driver_option_arguments),
+    ('simulate', 'Fake the reception of IR signals',
+     _add_simulate_arguments),
+    ('transmitters', 'Set transmitters', _add_transmitters_arguments),
+    ('version', 'Inquire version of the Lirc server. '
+     + ' (Use "--version" for the version of this program.)', None),
+    ('batch', 'Execute sub-commands, one per line, from a file or stdin',
+     _add_batch_arguments),
+    ('macro', 'Execute a timed sequence of key presses',
+     _add_macro_arguments),
+    ('daemon', 'Run a helper process keeping the connections open, '
+     + 'used by subsequent invocations', _add_daemon_arguments),
+    ('serve', 'Serve the Lirc server over HTTP/JSON',
+     _add_serve_arguments),
+]
+
+
+def _print_result(result, out):
+    """Prints the result of a sub-command, if any."""
+    if isinstance(result, list):
+        for line in result:
+            print(line, file=out)
+    elif result is not None:
+        print(result, file=out)
+
+
+def _print_fanout_result(result, out):
+    """Prints a FanoutResult, one line per host; returns the exit status."""
+    for address, host_result in result.items():
+        if not host_result.ok:
+            print("{0}: {1}: {2}".format(
+                address, type(host_result.error).__name__,
+                host_result.error), file=out)
+        elif isinstance(host_result.value, list):
+            for line in host_result.value:
+                print("{0}: {1}".format(address, line), file=out)
+        else:
+            print("{0}: {1}".format(
+                address, "OK" if host_result.value is None
+                else host_result.value), file=out)
+    return 0 if result.ok else 3
+
+
+def _run_subcommand(lirc, args, out=None):
+    """
+    Executes the sub-command given by the parsed arguments,
+    prints its result (on out, default sys.stdout),
+    and returns the exit status.
+    """
+    out = out or sys.stdout
+    commands = {
+        'send':
+            lambda: _send(lirc, args, out),
+        'start':
+            lambda: lirc.send_ir_command_repeat(args.remote, args.command),
+        'stop':
+            lambda: lirc.stop_ir(args.remote, args.command),
+        'remotes':
+            lambda: lirc.get_remotes(),
+        'commands':
+            lambda: lirc.get_commands(args.remote, args.codes),
+        'driver-option':
+            lambda: lirc.set_driver_option(args.key, args.value),
+        'simulate':
+            lambda: lirc.simulate(args.event_string),
+        'transmitters':
+            lambda: lirc.set_transmitters(args.transmitters),
+        'input-log':
+            lambda: lirc.set_input_log(args.log_file),
+        'version':
+            lambda: lirc.get_version(),
+        'batch':
+            lambda: _run_batch(lirc, args, out),
+        'macro':
+            lambda: _run_macro(lirc, args, out),
+    }
+
+    try:
+        exitstatus = 0
+        if args.subcommand in commands:
+            result = commands[args.subcommand]()
+            if args.subcommand in ('send', 'batch', 'macro'):
+                exitstatus = result
+            elif args.address and len(args.address) > 1:
+                exitstatus = _print_fanout_result(result, out)
+            else:
+                _print_result(result, out)
+        else:
+            print('Unknown or missing subcommand, use --help for syntax.',
+                  file=out)
+            exitstatus = 1
+
+    except LircServerException as ex:
+        print("LircServerError: {0}".format(ex), file=out)
+        exitstatus = 3
+    except BadPacketException as ex:
+        print("Malformed or unexpected package received: {0}".format(ex),
+              file=out)
+        exitstatus = 4
+    except socket.timeout:
+        print("Timeout occured (was {0}s).".format(args.timeout), file=out)
+        exitstatus = 5
+    return exitstatus
+
+
+def _send(lirc, args, out):
+    """
+    Sends the command(s) of the send sub-command; several commands are
+    written at once. The failing commands are reported, one per line.
+    Returns the exit status.
+    """
+    fanout = args.address and len(args.address) > 1
+    if len(args.command) == 1:
+        result = lirc.send_ir_command(args.remote, args.command[0],
+                                      args.count)
+        return _print_fanout_result(result, out) if fanout else 0
+    sequence = [(args.remote, command, args.count)
+                for command in args.command]
+    result = lirc.send_ir_command_batch(sequence)
+    hosts = result.items() if fanout else [(None, None)]
+    exitstatus = 0
+    for address, host_result in hosts:
+        prefix = "" if address is None else address + ": "
+        if host_result is not None and not host_result.ok:
+            print("{0}{1}: {2}".format(prefix,
+                                       type(host_result.error).__name__,
+                                       host_result.error), file=out)
+            exitstatus = 3
+            continue
+        outcomes = result if host_result is None else host_result.value
+        for command, error in zip(args.command, outcomes):
+            if error is not None:
+                print("{0}{1}: LircServerError: {2}".format(
+                    prefix, command, error), file=out)
+                exitstatus = 3
+    return exitstatus
+
+
+def _run_batch(lirc, args, out):
+    """
+    Executes the sub-commands in args.batch_file, one per line, over the
+    already open connection. Empty lines and lines starting with # are
+    ignored; "sleep seconds" pauses. After each line, its exit status
+    is reported as "line: exit status"; a line that cannot be parsed,
+    or has invalid arguments, has exit status 1.
+    Returns the first non-zero exit status, or 0.
+    """
+    import shlex
+    import time
+
+    parser = _build_parser()
+    try:
+        batch_file = sys.stdin if args.batch_file == '-' \
+            else open(args.batch_file)
+    except (IOError, OSError) as ex:
+        print("Cannot read {0}: {1}".format(args.batch_file, ex), file=out)
+        return 2
+    exitstatus = 0
+    try:
+        for lineno, line in enumerate(batch_file, 1):
+            try:
+                words = shlex.split(line, comments=True)
+            except ValueError as ex:
+                print("Cannot parse line: {0}".format(ex), file=out)
+                words = None
+            if words is None:
+                status = 1
+            elif not words:
+                continue
+            elif words[0] == 'sleep' and len(words) == 2:
+                try:
+                    time.sleep(float(words[1]))
+                    status = 0
+                except (ValueError, OverflowError):
+                    print("Invalid sleep duration: {0}".format(words[1]),
+                          file=out)
+                    status = 1
+            elif words[0] == 'batch':
+                print("Nested batch not allowed.", file=out)
+                status = 1
+            else:
+                try:
+                    line_args = parser.parse_args(words)
+                except SystemExit:
+                    status = 1
+                else:
+                    line_args.address = args.address
+                    line_args.timeout = args.timeout
+                    try:
+                        status = _run_subcommand(lirc, line_args, out)
+                    except ValueError as ex:
+                        print("{0}: {1}".format(type(ex).__name__, ex),
+                              file=out)
+                        status = 1
+            print("{0}: exit {1}".format(lineno, status), file=out)
+            out.flush()
+            exitstatus = exitstatus or status
+            if status and args.stop_on_error:
+                break
+            if args.delay:
+                time.sleep(args.delay)
+    finally:
+        if batch_file is not sys.stdin:
+            batch_file.close()
+    return exitstatus
+
+
+def _run_macro(lirc, args, out):
+    """
+    Executes the macro from args.macro_file and args.steps over the
+    already open connection. Returns the exit status.
+    """
+    from .macro import parse_macro, parse_duration, MacroError
+
+    if args.address and len(args.address) > 1:
+        print("Macros cannot be sent to several hosts.", file=out)
+        return 1
+    lines = []
+    if args.macro_file is not None:
+        macro_file = sys.stdin if args.macro_file == '-' \
+            else open(args.macro_file)
+        try:
+            lines = macro_file.readlines()
+        finally:
+            if macro_file is not sys.stdin:
+                macro_file.close()
+    try:
+        macro = parse_macro(lines + args.steps, args.remote,
+                            parse_duration(args.gap))
+        macro.run(lirc, args.validate)
+    except MacroError as ex:
+        print("Macro error: {0}".format(ex), file=out)
+        return 1
+    return 0
+
+
+def _code_cache_path(config):
+    """Returns the path of the cache file for the lircd.conf config."""
+    import hashlib
+    directory = os.environ.get('XDG_CACHE_HOME') \
+        or os.path.join(os.path.expanduser('~'), '.cache')
+    digest = hashlib.sha1(os.path.abspath(config).encode('utf-8'))
+    return os.path.join(directory, 'lirconian',
+                        'codes-{0}.cache'.format(digest.hexdigest()[:16]))
+
+
+def _serve(args):
+    """Runs the HTTP/JSON gateway until interrupted."""
+    import signal
+    from .gateway import LirconianGateway
+    if args.address and len(args.address) > 1:
+        print("serve is not supported with several hosts.")
+        return 1
+    scheduler = None
+    if args.rate is not None:
+        from .scheduler import CommandScheduler
+        scheduler = CommandScheduler(rate=args.rate,
+                                     burst=max(1, int(args.rate)),
+                                     max_in_flight=args.connections,
+                                     max_queue=1024)
+    options = dict(timeout=args.timeout, connections=args.connections,
+                   address=args.listen, port=args.http_port,
+                   scheduler=scheduler)
+    try:
+        if args.address:
+            gateway = LirconianGateway.tcp(args.address[0], args.port,
+                                           **options)
+        else:
+            gateway = LirconianGateway.unix(args.socket_pathname, **options)
+    except (socket.error, OverflowError) as ex:
+        print("Cannot listen on {0}:{1}: {2}"
+              .format(args.listen, args.http_port, ex))
+        return 2
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        gateway.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def main():
+    """Interface between the command line and the classes."""
+
+    args = parse_commandline()
+
+    if args.subcommand == 'daemon':
+        import signal
+        from .daemon import LirconianDaemon
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        try:
+            LirconianDaemon(args.daemon_socket).serve_forever()
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+
+    if args.subcommand == 'serve':
+        sys.exit(_serve(args))
+
+    database = None
+    if args.config is not None:
+        from .lircd_conf import load_database, LircdConfError
+        try:
+            database = load_database(args.config,
+                                     _code_cache_path(args.config))
+        except (LircdConfError, IOError, OSError) as ex:
+            print("Cannot read {0}: {1}".format(args.config, ex))
+            sys.exit(2)
+        if args.subcommand in ('remotes', 'commands'):
+            sys.exit(_run_subcommand(database, args))
+
+    lirc = None
+    try:
+        lirc = _new_lirconian(args)
+    except ClientInstantiationError as ex:
+        print("Cannot instantiate lirconian: {0}".format(ex))
+        sys.exit(2)
+
+    if database is not None and hasattr(lirc, 'set_code_database'):
+        lirc.set_code_database(database)
+    if args.capture is not None:
+        if args.address and len(args.address) > 1:
+            print("--capture is not supported with several hosts.")
+            sys.exit(1)
+        lirc.set_capture(args.capture)
+    metrics = None
+    if args.timing:
+        from .metrics import LatencyMetrics
+        metrics = LatencyMetrics()
+        lirc.add_timing_hook(metrics)
+
+    exitstatus = _run_subcommand(lirc, args)
+
+    if lirc:
+        lirc.close()
+    if metrics is not None:
+        metrics.report(sys.stderr)
+
+    sys.exit(exitstatus)
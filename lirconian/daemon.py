@@ -0,0 +1,283 @@
+# Copyright (C) 2017 Bengt Martensson.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see http://www.gnu.org/licenses/.
+
+"""
+Long-lived helper process for the lirconian command line program.
+
+The daemon ("lirconian daemon") listens on a private Unix domain socket,
+and keeps the connections to the Lirc servers, with the catalog cache
+enabled, open between invocations. When the daemon is running, the
+lirconian program forwards its arguments to it, and prints the output
+and exits with the status it gets back, instead of connecting to lircd
+itself. If no daemon is running, the program works as before.
+
+The protocol is one JSON object per line: the request contains the
+arguments ("argv") and the relevant environment ("env"),
+the response the output ("output") and the exit status ("status").
+"""
+
+import os
+import socket
+import sys
+
+# Arguments that are never forwarded to the daemon: batch, macro and
+# config read the client's stdin or files, verbose, timing and capture
+# output would end up in the daemon.
+_NOT_FORWARDED = set(['daemon', 'serve', 'batch', 'macro', '-v',
+                      '--verbose', '--timing', '--capture', '--config'])
+
+# Environment variables that influence the argument parsing.
+_FORWARDED_ENVIRONMENT = ['LIRC_SOCKET_PATH']
+
+
+def default_socket_path():
+    """
+    Returns the path of the daemon socket: $LIRCONIAN_DAEMON_SOCKET, or
+    lirconian-uid.sock in $XDG_RUNTIME_DIR or the temporary directory.
+    """
+    if 'LIRCONIAN_DAEMON_SOCKET' in os.environ:
+        return os.environ['LIRCONIAN_DAEMON_SOCKET']
+    directory = os.environ.get('XDG_RUNTIME_DIR')
+    if not directory:
+        import tempfile
+        directory = tempfile.gettempdir()
+    return os.path.join(directory, 'lirconian-{0}.sock'.format(os.getuid()))
+
+
+def forward(argv, socket_path=None, out=None):
+    """
+    Forwards the command line to the daemon, and prints its output.
+    Returns the exit status, or None if the daemon is not running,
+    or the command line should not be forwarded.
+    """
+    if _NOT_FORWARDED.intersection(arg.split('=', 1)[0] for arg in argv):
+        return None
+    socket_path = socket_path or default_socket_path()
+    try:
+        # Only to a daemon of the same user, since the socket may be in
+        # the shared temporary directory.
+        if os.stat(socket_path).st_uid != os.getuid():
+            return None
+    except OSError:
+        return None
+    import json
+    out = out or sys.stdout
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            sock.connect(socket_path)
+            request = {'argv': list(argv),
+                       'env': dict((key, os.environ[key])
+                                   for key in _FORWARDED_ENVIRONMENT
+                                   if key in os.environ)}
+            sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        except socket.error:
+            return None                 # not received; run it directly
+        try:
+            response = json.loads(_read_line(sock).decode('utf-8'))
+            output, status = response['output'], response['status']
+        except (socket.error, ValueError, KeyError, TypeError) as ex:
+            # The command may have been executed; do not run it again.
+            out.write("No valid answer from the lirconian daemon: {0}\n"
+                      .format(ex))
+            return 2
+    finally:
+        sock.close()
+    out.write(output)
+    return status
+
+
+def _read_line(sock):
+    chunks = []
+    while True:
+        chunk = sock.recv(4096)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        if chunk.endswith(b'\n'):
+            break
+    return b''.join(chunks)
+
+
+def _capturing_parser_class(output):
+    """
+    Returns an ArgumentParser class writing its messages to output.stream,
+    output being a threading.local. (Created on demand, to keep argparse
+    out of the forwarding client.)
+    """
+    import argparse
+
+    class CapturingArgumentParser(argparse.ArgumentParser):
+        """ArgumentParser writing to the current request's output."""
+
+        def _print_message(self, message, file=None):
+            if message:
+                output.stream.write(message)
+
+    return CapturingArgumentParser
+
+
+class LirconianDaemon(object):
+    """
+    Serves the forwarded command lines over a Unix domain socket.
+    Connections to the Lirc servers are opened on first use,
+    kept open with the catalog cache enabled, and reopened if broken.
+    Requests to the same Lirc server are serialized.
+    """
+
+    def __init__(self, socket_path=None):
+        import threading
+
+        self._socket_path = socket_path or default_socket_path()
+        self._server = None
+        self._connections = {}
+        self._lock = threading.Lock()
+        self._output = threading.local()
+        self._parser_class = _capturing_parser_class(self._output)
+
+    def serve_forever(self):
+        """Listen on the daemon socket until shutdown() is called."""
+        import json
+        import socketserver
+
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            """Handles one forwarded command line."""
+
+            def handle(self):
+                try:
+                    request = json.loads(
+                        self.rfile.readline().decode('utf-8'))
+                    argv, environ = request['argv'], request.get('env', {})
+                except (ValueError, KeyError, TypeError) as ex:
+                    output, status = "Malformed request: {0}\n".format(ex), 2
+                else:
+                    output, status = daemon.execute(argv, environ)
+                response = {'output': output, 'status': status}
+                self.wfile.write(json.dumps(response).encode('utf-8')
+                                 + b'\n')
+
+        if os.path.exists(self._socket_path):
+            os.unlink(self._socket_path)
+        old_umask = os.umask(0o077)
+        try:
+            self._server = socketserver.ThreadingUnixStreamServer(
+                self._socket_path, Handler)
+        finally:
+            os.umask(old_umask)
+        self._server.daemon_threads = True
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            if os.path.exists(self._socket_path):
+                os.unlink(self._socket_path)
+            self.close()
+
+    def shutdown(self):
+        """Stops serve_forever (from another thread)."""
+        if self._server is not None:
+            self._server.shutdown()
+
+    def close(self):
+        """Closes the connections to the Lirc servers."""
+        with self._lock:
+            for lirc, _ in self._connections.values():
+                lirc.close()
+            self._connections.clear()
+
+    def execute(self, argv, environ):
+        """
+        Executes a command line, returns its output and exit status.
+        """
+        # pylint: disable=protected-access
+        import io
+        from .cli import _build_parser, _run_subcommand
+
+        out = io.StringIO()
+        self._output.stream = out
+        try:
+            args = _build_parser(argv, self._parser_class, environ) \
+                .parse_args(argv)
+        except SystemExit as ex:
+            return out.getvalue(), ex.code or 0
+        if args.subcommand in _NOT_FORWARDED:
+            return "Sub-command not supported by the daemon\n", 1
+
+        key = (args.socket_pathname,) if not args.address \
+            else (tuple(args.address), args.port)
+        for attempt in (1, 2):
+            try:
+                lirc, lock = self._connection(key, args)
+            except Exception as ex:  # pylint: disable=broad-except
+                return "Cannot instantiate lirconian: {0}\n".format(ex), 2
+            out = io.StringIO()
+            with lock:
+                if attempt == 1 and not _alive(lirc):
+                    # Stale connection, e.g. after a lircd restart.
+                    self._drop(key)
+                    continue
+                try:
+                    lirc.set_timeout(args.timeout)
+                    status = _run_subcommand(lirc, args, out)
+                    return out.getvalue(), status
+                except socket.error as ex:
+                    # The command may have been carried out already,
+                    # so it is not sent again.
+                    self._drop(key)
+                    return out.getvalue() \
+                        + "Connection error: {0}\n".format(ex), 2
+                except Exception as ex:  # pylint: disable=broad-except
+                    # The state of the connection is unknown.
+                    self._drop(key)
+                    return out.getvalue() + "{0}: {1}\n".format(
+                        type(ex).__name__, ex), 1
+
+    def _connection(self, key, args):
+        import threading
+        from . import AbstractLirconian
+        from .cli import _new_lirconian
+
+        with self._lock:
+            if key not in self._connections:
+                lirc = _new_lirconian(args)
+                if isinstance(lirc, AbstractLirconian):
+                    lirc.enable_catalog_cache()
+                self._connections[key] = (lirc, threading.Lock())
+            return self._connections[key]
+
+    def _drop(self, key):
+        with self._lock:
+            lirc = self._connections.pop(key, (None, None))[0]
+        if lirc is not None:
+            lirc.close()
+
+
+def _alive(lirc):
+    """
+    True unless lirc is a connection closed by the Lirc server, which is
+    found out by reading what it has sent, without sending a command.
+    """
+    # pylint: disable=protected-access
+    from . import AbstractLirconian, CONNECTION_ERRORS
+
+    if not isinstance(lirc, AbstractLirconian):
+        return True
+    try:
+        lirc._poll_broadcasts()
+        return True
+    except CONNECTION_ERRORS:
+        return False
@@ -0,0 +1,53 @@
+# Copyright (C) 2017 Bengt Martensson.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see http://www.gnu.org/licenses/.
+
+"""
+Decoded button events, as broadcast by lircd to its clients.
+"""
+
+import collections
+
+# Maximal number of events buffered by a connection, waiting to be consumed.
+EVENT_BUFFER_SIZE = 1000
+
+
+class IrEvent(collections.namedtuple('IrEvent',
+                                     ['code', 'repeat', 'button', 'remote'])):
+    """
+    A decoded button press: the code and the repeat count (integers),
+    the name of the button, and the name of the remote.
+    """
+    __slots__ = ()
+
+
+def parse_event(line):
+    """
+    Parses a line "code repeat button remote", as broadcast by lircd,
+    given as bytes or string. Returns an IrEvent, or None if the line
+    is not an event.
+    """
+    fields = line.split()
+    if len(fields) != 4:
+        return None
+    try:
+        code = int(fields[0], 16)
+        repeat = int(fields[1], 16)
+    except ValueError:
+        return None
+    button, remote = fields[2], fields[3]
+    if isinstance(button, bytes):
+        button = button.decode("US-ASCII", "replace")
+        remote = remote.decode("US-ASCII", "replace")
+    return IrEvent(code, repeat, button, remote)
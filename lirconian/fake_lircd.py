@@ -0,0 +1,311 @@
+# Copyright (C) 2017 Bengt Martensson.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see http://www.gnu.org/licenses/.
+
+"""
+A fake Lirc server, for testing and benchmarking without IR hardware.
+
+It speaks the lircd socket protocol (BEGIN/command/SUCCESS|ERROR/DATA/END)
+over a Unix domain socket and/or TCP, has a synthetic catalog of
+configurable size, can add a latency to each reply, and can broadcast
+SIGHUP packets and decoded button events to all connected clients.
+SIMULATE broadcasts its argument as an event, like lircd does.
+
+Usage from Python:
+    with FakeLircd(socket_path='/tmp/fake-lircd', port=0) as server:
+        lirc = TcpLirconian('localhost', server.port)
+        ...
+
+or from the command line:
+    python -m lirconian.fake_lircd --socket /tmp/fake-lircd --port 8765
+"""
+
+import argparse
+import os
+import socket
+import threading
+import time
+
+try:
+    import socketserver
+except ImportError:                                     # Python 2
+    import SocketServer as socketserver
+
+VERSION = "0.10.0-fake"
+
+
+def make_catalog(remotes=2, commands=50):
+    """
+    Returns a synthetic catalog, a dictionary remote name ->
+    list of (code, command name) pairs.
+    """
+    return dict(('remote{0}'.format(r),
+                 [(r << 16 | c, 'KEY_{0}'.format(c)) for c in range(commands)])
+                for r in range(remotes))
+
+
+class FakeLircd(object):
+    """
+    Fake Lirc server. Serves on socket_path (if not None) and on TCP
+    port port of address (if port is not None; 0 picks a free port,
+    available as the attribute port after start()).
+    Each reply is delayed by latency seconds.
+    The received commands are counted in the attribute
+    commands_received, the accepted SEND_ONCE/SEND_START/SEND_STOP
+    packets are appended to the list transmitted.
+    """
+
+    def __init__(self, socket_path=None, port=None, address='localhost',
+                 catalog=None, latency=0.0):
+        self.socket_path = socket_path
+        self.port = port
+        self.address = address
+        self.catalog = catalog if catalog is not None else make_catalog()
+        self.latency = latency
+        self.commands_received = 0
+        self.transmitted = []
+        self.transmitters_mask = None
+        self._servers = []
+        self._clients = set()
+        self._names = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def start(self):
+        """Starts serving in background threads."""
+        handler = self._handler_class()
+        if self.socket_path is not None:
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            self._servers.append(
+                _ThreadingUnixServer(self.socket_path, handler))
+        if self.port is not None:
+            server = _ThreadingTcpServer((self.address, self.port), handler)
+            self.port = server.server_address[1]
+            self._servers.append(server)
+        for server in self._servers:
+            thread = threading.Thread(target=server.serve_forever)
+            thread.daemon = True
+            thread.start()
+
+    def stop(self):
+        """Stops serving, and disconnects all clients."""
+        for server in self._servers:
+            server.shutdown()
+            server.server_close()
+        self._servers = []
+        with self._lock:
+            clients = list(self._clients)
+        for client in clients:
+            client.disconnect()
+        if self.socket_path is not None and os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def broadcast(self, text):
+        """Sends text (one or more complete lines) to all clients."""
+        with self._lock:
+            clients = list(self._clients)
+        for client in clients:
+            client.write(text)
+
+    def broadcast_sighup(self):
+        """Broadcasts a SIGHUP packet, as lircd does when reloading."""
+        self.broadcast("BEGIN\nSIGHUP\nEND\n")
+
+    def broadcast_event(self, code, repeat, button, remote):
+        """Broadcasts a decoded button press."""
+        self.broadcast("{0:016x} {1:02x} {2} {3}\n".format(
+            code, repeat, button, remote))
+
+    def reply(self, packet):
+        """Returns the reply to a packet (without trailing newline)."""
+        words = packet.split()
+        verb = words[0].upper() if words else ""
+        handler = getattr(self, '_do_' + verb.lower(), None)
+        if handler is None:
+            return _reply(packet, False, ['unknown directive: "{0}"'
+                                          .format(verb)])
+        try:
+            return handler(packet, words[1:])
+        except (ValueError, IndexError):
+            return _reply(packet, False, ['bad send packet'])
+
+    # pylint: disable=missing-docstring,unused-argument
+
+    def _do_version(self, packet, args):
+        return _reply(packet, True, [VERSION])
+
+    def _do_list(self, packet, args):
+        if not args:
+            return _reply(packet, True, sorted(self.catalog))
+        if args[0] not in self.catalog:
+            return _reply(packet, False,
+                          ['unknown remote: "{0}"'.format(args[0])])
+        return _reply(packet, True,
+                      ['{0:016x} {1}'.format(code, name)
+                       for code, name in self.catalog[args[0]]])
+
+    def _send(self, packet, args):
+        if args[0] not in self.catalog:
+            return _reply(packet, False,
+                          ['unknown remote: "{0}"'.format(args[0])])
+        if args[1] not in self._command_names(args[0]):
+            return _reply(packet, False,
+                          ['unknown command: "{0}"'.format(args[1])])
+        if len(args) > 2:
+            int(args[2])
+        with self._lock:
+            self.transmitted.append(packet)
+        return _reply(packet, True)
+
+    _do_send_once = _send
+    _do_send_start = _send
+    _do_send_stop = _send
+
+    def _command_names(self, remote):
+        commands = self.catalog[remote]
+        names = self._names.get(remote)
+        if names is None or names[0] is not commands:
+            names = (commands, set(name for _, name in commands))
+            self._names[remote] = names
+        return names[1]
+
+    def _do_set_transmitters(self, packet, args):
+        self.transmitters_mask = int(args[0])
+        return _reply(packet, True)
+
+    def _do_set_inputlog(self, packet, args):
+        return _reply(packet, True)
+
+    def _do_drv_option(self, packet, args):
+        return _reply(packet, True)
+
+    def _do_simulate(self, packet, args):
+        self.broadcast(' '.join(args) + '\n')
+        return _reply(packet, True)
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            """Serves one client connection."""
+
+            def setup(self):
+                if self.request.family != getattr(socket, 'AF_UNIX', None):
+                    self.request.setsockopt(socket.IPPROTO_TCP,
+                                            socket.TCP_NODELAY, 1)
+                socketserver.StreamRequestHandler.setup(self)
+                self._write_lock = threading.Lock()
+                with server._lock:
+                    server._clients.add(self)
+
+            def finish(self):
+                with server._lock:
+                    server._clients.discard(self)
+                try:
+                    socketserver.StreamRequestHandler.finish(self)
+                except socket.error:
+                    pass
+
+            def write(self, text):
+                try:
+                    with self._write_lock:
+                        self.wfile.write(text.encode('US-ASCII'))
+                        self.wfile.flush()
+                except (socket.error, ValueError):
+                    pass
+
+            def disconnect(self):
+                try:
+                    self.request.shutdown(socket.SHUT_RDWR)
+                except socket.error:
+                    pass
+
+            def handle(self):
+                for line in self.rfile:
+                    packet = line.decode('US-ASCII').strip()
+                    if not packet:
+                        continue
+                    server.commands_received += 1
+                    if server.latency:
+                        time.sleep(server.latency)
+                    self.write(server.reply(packet) + '\n')
+
+        return Handler
+
+
+def _reply(packet, success, data=None):
+    lines = ['BEGIN', packet, 'SUCCESS' if success else 'ERROR']
+    if data is not None:
+        lines += ['DATA', str(len(data))] + list(data)
+    lines.append('END')
+    return '\n'.join(lines)
+
+
+class _ThreadingUnixServer(socketserver.ThreadingMixIn,
+                           socketserver.UnixStreamServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class _ThreadingTcpServer(socketserver.ThreadingMixIn,
+                          socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+def main():
+    """Runs a fake Lirc server from the command line."""
+    parser = argparse.ArgumentParser(
+        prog='fake_lircd',
+        description='Fake Lirc server, for testing and benchmarking.')
+    parser.add_argument('-s', '--socket', dest='socket_path', default=None,
+                        help='Path of the Unix domain socket')
+    parser.add_argument('-p', '--port', type=int, default=None,
+                        help='TCP port')
+    parser.add_argument('-a', '--address', default='localhost',
+                        help='Address to listen to, default localhost')
+    parser.add_argument('-r', '--remotes', type=int, default=2,
+                        help='Number of remotes, default 2')
+    parser.add_argument('-c', '--commands', type=int, default=50,
+                        help='Number of commands per remote, default 50')
+    parser.add_argument('-l', '--latency', type=float, default=0.0,
+                        help='Delay of each reply in seconds, default 0')
+    args = parser.parse_args()
+    if args.socket_path is None and args.port is None:
+        parser.error('At least one of --socket and --port must be given')
+
+    server = FakeLircd(args.socket_path, args.port, args.address,
+                       make_catalog(args.remotes, args.commands),
+                       args.latency)
+    server.start()
+    print("Serving on {0}".format(
+        ', '.join(str(x) for x in (args.socket_path, server.port)
+                  if x is not None)))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
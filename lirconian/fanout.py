@@ -0,0 +1,231 @@
+# Copyright (C) 2017 Bengt Martensson.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see http://www.gnu.org/licenses/.
+
+"""
+Fan-out client, broadcasting commands to several Lirc servers concurrently.
+"""
+
+import collections
+import socket
+from concurrent.futures import ThreadPoolExecutor
+
+from . import TcpLirconian, LircServerException, ClientInstantiationError, \
+    DEFAULT_PORT
+from .reply_parser import BadPacketException
+
+
+# Errors that are reported per host, instead of being thrown.
+HOST_ERRORS = (LircServerException, BadPacketException, socket.error,
+               ClientInstantiationError)
+
+
+class HostResult(object):
+    """
+    The outcome of a command on one host: either a value
+    (None for commands not returning anything), or an error.
+    """
+
+    def __init__(self, address, value=None, error=None):
+        self.address = address
+        self.value = value
+        self.error = error
+
+    @property
+    def ok(self):
+        """True if the command succeeded on the host."""
+        return self.error is None
+
+    def __repr__(self):
+        return "HostResult({0!r}, value={1!r}, error={2!r})".format(
+            self.address, self.value, self.error)
+
+
+class FanoutResult(collections.OrderedDict):
+    """
+    Ordered mapping from host address to its HostResult,
+    in the order the hosts were given.
+    """
+
+    @property
+    def ok(self):
+        """True if the command succeeded on all hosts."""
+        return all(result.ok for result in self.values())
+
+    @property
+    def errors(self):
+        """Returns a dictionary address -> error of the failing hosts."""
+        return collections.OrderedDict(
+            (address, result.error)
+            for address, result in self.items() if not result.ok)
+
+    @property
+    def values_by_host(self):
+        """Returns a dictionary address -> value of the succeeding hosts."""
+        return collections.OrderedDict(
+            (address, result.value)
+            for address, result in self.items() if result.ok)
+
+
+class MultiLirconian(object):
+    """
+    Sends commands to several Lirc servers over TCP concurrently, so that
+    the total latency is that of the slowest host, rather than the sum.
+    The methods mirror the ones of AbstractLirconian, but return a
+    FanoutResult instead of throwing on per-host errors.
+    Connections are opened on first use, and reopened after a
+    connection error.
+    """
+
+    def __init__(self, addresses, port=DEFAULT_PORT, verbose=False,
+                 timeout=None, max_workers=None):
+        self._addresses = list(addresses)
+        self._port = port
+        self._verbose = verbose
+        self._timeout = timeout
+        self._connections = {}
+        self._timing_hooks = []
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers or max(1, len(self._addresses)))
+
+    @property
+    def addresses(self):
+        """The addresses of the hosts."""
+        return list(self._addresses)
+
+    def close(self):
+        """Close all connections."""
+        self._executor.shutdown()
+        for lirc in self._connections.values():
+            lirc.close()
+        self._connections.clear()
+
+    def _connection(self, address):
+        lirc = self._connections.get(address)
+        if lirc is None:
+            try:
+                lirc = TcpLirconian(address, self._port,
+                                    self._verbose, self._timeout)
+            except Exception as ex:
+                raise ClientInstantiationError(ex)
+            for hook in self._timing_hooks:
+                lirc.add_timing_hook(hook)
+            self._connections[address] = lirc
+        return lirc
+
+    def _call(self, address, method, args):
+        try:
+            return HostResult(
+                address, getattr(self._connection(address), method)(*args))
+        except HOST_ERRORS as ex:
+            if not isinstance(ex, LircServerException):
+                lirc = self._connections.pop(address, None)
+                if lirc:
+                    lirc.close()
+            return HostResult(address, error=ex)
+
+    def _broadcast(self, method, *args):
+        futures = [self._executor.submit(self._call, address, method, args)
+                   for address in self._addresses]
+        result = FanoutResult()
+        for future in futures:
+            host_result = future.result()
+            result[host_result.address] = host_result
+        return result
+
+    def send_ir_command(self, remote, command, count, transmitters=None):
+        """
+        Transmits the named command on all hosts, with the given
+        transmitters if not None.
+        """
+        return self._broadcast('send_ir_command', remote, command, count,
+                               transmitters)
+
+    def send_ir_command_sequence(self, sequence):
+        """Transmits a sequence of (remote, command, count) on all hosts."""
+        return self._broadcast('send_ir_command_sequence', list(sequence))
+
+    def send_ir_commands(self, remote, commands, count=1):
+        """Transmits several commands of one remote on all hosts."""
+        return self._broadcast('send_ir_commands', remote, list(commands),
+                               count)
+
+    def send_ir_command_batch(self, sequence):
+        """
+        Transmits a sequence of (remote, command, count) on all hosts;
+        the value per host is the list of outcomes.
+        """
+        return self._broadcast('send_ir_command_batch', list(sequence))
+
+    def send_ir_command_repeat(self, remote, command):
+        """Starts transmitting the named command on all hosts."""
+        return self._broadcast('send_ir_command_repeat', remote, command)
+
+    def stop_ir(self, remote=None, command=None):
+        """Stops transmitting the named command on all hosts."""
+        return self._broadcast('stop_ir', remote, command)
+
+    def get_remotes(self):
+        """Returns the lists of remotes of all hosts."""
+        return self._broadcast('get_remotes')
+
+    def get_commands(self, remote, include_codes=False):
+        """Returns the lists of commands in the remote of all hosts."""
+        return self._broadcast('get_commands', remote, include_codes)
+
+    def set_transmitters(self, transmitters):
+        """Sets the transmitters on all hosts."""
+        return self._broadcast('set_transmitters', list(transmitters))
+
+    def set_transmitters_mask(self, mask):
+        """Sets the transmitter mask on all hosts."""
+        return self._broadcast('set_transmitters_mask', mask)
+
+    def get_version(self):
+        """Returns the version strings of all hosts."""
+        return self._broadcast('get_version')
+
+    def set_input_log(self, path):
+        """Sets the input log path on all hosts."""
+        return self._broadcast('set_input_log', path)
+
+    def set_driver_option(self, key, value):
+        """Sets a driver option on all hosts."""
+        return self._broadcast('set_driver_option', key, value)
+
+    def simulate(self, event_string):
+        """Sends the event string for simulation to all hosts."""
+        return self._broadcast('simulate', event_string)
+
+    def set_verbose(self, verbose):
+        """Sets the verbosity of all connections."""
+        self._verbose = verbose
+        for lirc in self._connections.values():
+            lirc.set_verbose(verbose)
+
+    def add_timing_hook(self, hook):
+        """
+        Registers a timing hook on all connections (see
+        AbstractLirconian.add_timing_hook). It is called from several
+        threads.
+        """
+        self._timing_hooks.append(hook)
+        for lirc in self._connections.values():
+            lirc.add_timing_hook(hook)
+
+    def set_timeout(self, timeout):
+        """Sets the timeout of all connections."""
+        self._timeout = timeout
+        for lirc in self._connections.values():
+            lirc.set_timeout(timeout)
@@ -0,0 +1,365 @@
+# Copyright (C) 2017 Bengt Martensson.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see http://www.gnu.org/licenses/.
+
+"""
+HTTP/JSON gateway to a Lirc server ("lirconian serve").
+
+Requests are served by a thread each, over a LirconianPool of
+long-lived connections with the catalog cache enabled.
+
+    GET  /version                       {"version": "0.10.0"}
+    GET  /remotes                       {"remotes": [...]}
+    GET  /remotes/<remote>[?codes=1]    {"commands": [...]}
+    GET  /scheduler                     {"statistics": {...}}
+    POST /send          {"remote": r, "command": c, "count": 1,
+                         "transmitters": [1, 2]}
+                        or {"remote": r, "commands": [c, ...]}
+    POST /start         {"remote": r, "command": c}
+    POST /stop          {"remote": r, "command": c}
+    POST /transmitters  {"transmitters": [1, 2]}
+    POST /batch         {"commands": [{"remote": r, "command": c,
+                                       "count": 1, "transmitters": [1]},
+                                      ...]}
+                        -> {"results": [{"ok": true},
+                                        {"ok": false, "error": "..."}]}
+
+The count and transmitters are optional. Successful requests return
+status 200 and {"ok": true, ...}; errors return {"ok": false, "error":
+message} with status 400 (bad request), 404 (unknown path), 422
+(rejected by lircd), 500 (internal error), 502 (connection problem),
+503 (no connection available, or scheduler queue full), or 504 (timeout).
+"""
+
+import json
+import socket
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlsplit, parse_qs, unquote
+except ImportError:                                     # Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlsplit, parse_qs
+    from urllib import unquote
+
+from . import LircServerException, CONNECTION_ERRORS
+from .pool import LirconianPool, PoolExhaustedException
+from .scheduler import SchedulerFullException
+
+DEFAULT_HTTP_PORT = 8080
+
+# Maximal size of a request body.
+MAX_BODY = 1 << 20
+
+_REQUIRED = object()
+
+
+class GatewayError(Exception):
+    """An error reported to the HTTP client with the given status."""
+
+    def __init__(self, status, message):
+        Exception.__init__(self, message)
+        self.status = status
+
+
+class LirconianGateway(object):
+    """
+    Serves the HTTP/JSON API on address:port, using the connections of
+    pool. The pool's connections should have their catalog cache enabled;
+    see the classmethods unix and tcp.
+    """
+
+    def __init__(self, pool, address='localhost', port=DEFAULT_HTTP_PORT,
+                 acquire_timeout=10.0, scheduler=None):
+        """
+        The scheduler (a scheduler.CommandScheduler), if given, is the one
+        set on the pool's connections, and reported on /scheduler.
+        """
+        self._pool = pool
+        self._scheduler = scheduler
+        self._acquire_timeout = acquire_timeout
+        self._server = _ThreadingHTTPServer((address, port),
+                                            self._handler_class())
+
+    @classmethod
+    def unix(cls, socket_path, timeout=None, connections=4, scheduler=None,
+             **kwargs):
+        """Returns a gateway to lircd on the Unix domain socket."""
+        from . import UnixDomainSocketLirconian
+        return cls(LirconianPool(
+            lambda: _prepared(UnixDomainSocketLirconian(socket_path,
+                                                        timeout=timeout),
+                              scheduler),
+            max_size=connections), scheduler=scheduler, **kwargs)
+
+    @classmethod
+    def tcp(cls, lirc_address, lirc_port, timeout=None, connections=4,
+            scheduler=None, **kwargs):
+        """Returns a gateway to lircd on TCP lirc_address:lirc_port."""
+        from . import TcpLirconian
+        return cls(LirconianPool(
+            lambda: _prepared(TcpLirconian(lirc_address, lirc_port,
+                                           timeout=timeout),
+                              scheduler),
+            max_size=connections), scheduler=scheduler, **kwargs)
+
+    @property
+    def server_address(self):
+        """The (address, port) served."""
+        return self._server.server_address
+
+    def serve_forever(self):
+        """Serves until shutdown() is called."""
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            self._pool.close()
+
+    def shutdown(self):
+        """Stops serve_forever (from another thread)."""
+        self._server.shutdown()
+
+    def handle(self, method, path, query, body):
+        """
+        Executes a request. Returns the response object;
+        throws GatewayError.
+        """
+        parts = [unquote(part) for part in path.strip('/').split('/')]
+        if method == 'GET':
+            if parts == ['version']:
+                return {'version': self._execute(
+                    lambda lirc: lirc.get_version())}
+            if parts == ['remotes']:
+                return {'remotes': self._execute(
+                    lambda lirc: lirc.get_remotes())}
+            if len(parts) == 2 and parts[0] == 'remotes':
+                if not _is_name(parts[1]):
+                    raise GatewayError(400, "Invalid remote name")
+                codes = query.get('codes', ['0'])[0] not in ('0', 'false', '')
+                return {'commands': self._execute(
+                    lambda lirc: lirc.get_commands(parts[1], codes))}
+            if parts == ['scheduler'] and self._scheduler is not None:
+                return {'statistics': self._scheduler.statistics()}
+        elif method == 'POST' and len(parts) == 1 \
+                and parts[0] in self._POST_HANDLERS:
+            request = _parse_body(body)
+            return self._POST_HANDLERS[parts[0]](self, request)
+        raise GatewayError(404, "No such resource: {0} {1}"
+                           .format(method, path))
+
+    def _send(self, request):
+        remote = _field(request, 'remote')
+        count = _field(request, 'count', int, 1)
+        transmitters = _transmitters_field(request)
+        if 'commands' in request:
+            sequence = [(remote, command, count, transmitters)
+                        for command in _names_field(request, 'commands')]
+            self._execute(_forgetting_transmitters(
+                lambda lirc: lirc.send_ir_command_sequence(sequence)))
+        else:
+            command = _field(request, 'command')
+            self._execute(_forgetting_transmitters(
+                lambda lirc: lirc.send_ir_command(remote, command, count,
+                                                  transmitters)))
+        return {}
+
+    def _start(self, request):
+        remote = _field(request, 'remote')
+        command = _field(request, 'command')
+        self._execute(
+            lambda lirc: lirc.send_ir_command_repeat(remote, command))
+        return {}
+
+    def _stop(self, request):
+        remote = _field(request, 'remote')
+        command = _field(request, 'command')
+        self._execute(lambda lirc: lirc.stop_ir(remote, command))
+        return {}
+
+    def _transmitters(self, request):
+        transmitters = _transmitters_field(request, _REQUIRED)
+        self._execute(_forgetting_transmitters(
+            lambda lirc: lirc.set_transmitters(transmitters)))
+        return {}
+
+    def _batch(self, request):
+        sequence = [(_field(item, 'remote'), _field(item, 'command'),
+                     _field(item, 'count', int, 1),
+                     _transmitters_field(item))
+                    for item in _field(request, 'commands', list)]
+        outcomes = self._execute(_forgetting_transmitters(
+            lambda lirc: lirc.send_ir_command_batch(sequence)))
+        return {'results': [{'ok': True} if error is None
+                            else {'ok': False, 'error': str(error)}
+                            for error in outcomes]}
+
+    _POST_HANDLERS = {
+        'send': _send,
+        'start': _start,
+        'stop': _stop,
+        'transmitters': _transmitters,
+        'batch': _batch,
+    }
+
+    def _execute(self, function):
+        """Runs function with a pooled connection; maps the errors."""
+        try:
+            return self._pool.execute(function, self._acquire_timeout)
+        except LircServerException as ex:
+            raise GatewayError(422, str(ex))
+        except (PoolExhaustedException, SchedulerFullException) as ex:
+            raise GatewayError(503, str(ex))
+        except socket.timeout:
+            raise GatewayError(504, "Timeout from the Lirc server")
+        except CONNECTION_ERRORS as ex:
+            raise GatewayError(502, "{0}: {1}".format(type(ex).__name__,
+                                                      ex))
+
+    def _handler_class(self):
+        gateway = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """Serves one HTTP request."""
+
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):  # pylint: disable=invalid-name
+                self._respond('GET')
+
+            def do_POST(self):  # pylint: disable=invalid-name
+                self._respond('POST')
+
+            def _respond(self, method):
+                url = urlsplit(self.path)
+                try:
+                    length = int(self.headers.get('Content-Length') or 0)
+                    if length > MAX_BODY:
+                        raise GatewayError(400, "Request too large")
+                    body = self.rfile.read(length) if length else b''
+                    result = gateway.handle(method, url.path,
+                                            parse_qs(url.query), body)
+                    result['ok'] = True
+                    status = 200
+                except GatewayError as ex:
+                    result = {'ok': False, 'error': str(ex)}
+                    status = ex.status
+                except ValueError as ex:
+                    result = {'ok': False, 'error': str(ex)}
+                    status = 400
+                except Exception as ex:  # pylint: disable=broad-except
+                    result = {'ok': False, 'error': "{0}: {1}".format(
+                        type(ex).__name__, ex)}
+                    status = 500
+                data = json.dumps(result).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):  # pylint: disable=arguments-differ
+                pass
+
+        return Handler
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+
+def _prepared(lirc, scheduler):
+    lirc.enable_catalog_cache()
+    lirc.set_scheduler(scheduler)
+    return lirc
+
+
+def _forgetting_transmitters(function):
+    """
+    Returns function, preceded by forgetting the transmitters remembered
+    by the connection: another connection of the pool may have changed
+    them, since lircd has only one setting for all clients.
+    """
+    def forgetting(lirc):
+        lirc.forget_transmitters()
+        return function(lirc)
+    return forgetting
+
+
+def _parse_body(body):
+    try:
+        request = json.loads(body.decode('utf-8')) if body else {}
+    except ValueError:
+        raise GatewayError(400, "Request body is not valid JSON")
+    if not isinstance(request, dict):
+        raise GatewayError(400, "Request body must be a JSON object")
+    return request
+
+
+def _field(request, name, kind=None, default=_REQUIRED):
+    """
+    Returns request[name], checked to be of kind (default string),
+    or default if missing or null.
+    """
+    if not isinstance(request, dict):
+        raise GatewayError(400, "Expected a JSON object")
+    value = request.get(name)
+    if value is None:
+        if default is not _REQUIRED:
+            return default
+        raise GatewayError(400, "Missing field: " + name)
+    if kind is int:
+        if not isinstance(value, int) or isinstance(value, bool) \
+                or value < 1:
+            raise GatewayError(400, "Field {0} must be a positive integer"
+                               .format(name))
+    elif kind is list:
+        if not isinstance(value, list):
+            raise GatewayError(400, "Field {0} must be a list".format(name))
+    elif not _is_name(value):
+        raise GatewayError(400, "Field {0} must be a name".format(name))
+    return value
+
+
+def _names_field(request, name):
+    """
+    Returns the list request[name], with every element checked to be a
+    name, so that no text can be smuggled into the lircd protocol.
+    """
+    values = _field(request, name, list)
+    if not all(_is_name(value) for value in values):
+        raise GatewayError(400, "Field {0} must be a list of names"
+                           .format(name))
+    return values
+
+
+def _transmitters_field(request, default=None):
+    """Returns the list of transmitter numbers request['transmitters']."""
+    values = _field(request, 'transmitters', list, default)
+    if values is not None and not all(
+            isinstance(value, int) and not isinstance(value, bool)
+            and value >= 1 for value in values):
+        raise GatewayError(400, "Field transmitters must be a list of "
+                           "positive integers")
+    return values
+
+
+def _is_name(value):
+    """True if value is a non-empty string without whitespace."""
+    return isinstance(value, (str, type(u''))) and bool(value) \
+        and not any(char.isspace() for char in value)
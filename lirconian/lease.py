@@ -0,0 +1,189 @@
+# Copyright (C) 2017 Bengt Martensson.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see http://www.gnu.org/licenses/.
+
+"""
+Leased repeats: SEND_START with a guaranteed SEND_STOP.
+
+A RepeatLease is the right to keep a command repeating. It ends, and
+SEND_STOP is sent, when it is stopped, when the with block using it is
+left (also by an exception), when its duration expires, or when the
+interpreter exits. Expiry and exit are handled by a watchdog thread,
+which sends the SEND_STOP over a connection of its own, so that the
+connection of the lease is never used by two threads at once.
+
+Usage:
+    with lirc.lease_repeat('tv', 'KEY_VOLUMEUP', duration=3):
+        time.sleep(1.5)
+or
+    lease = lirc.lease_repeat('tv', 'KEY_VOLUMEUP', duration=0.5)
+    ...
+    lease.renew(0.5)            # keep going for another 0.5 s
+    ...
+    lease.stop()
+
+If the process is killed outright (SIGKILL, power loss), no client code
+runs; lircd then repeats until its own limit.
+"""
+
+import atexit
+import heapq
+import itertools
+import threading
+
+from .catalog import _now
+
+
+class RepeatLease(object):
+    """
+    A repeating command of a Lirconian, started by lease_repeat.
+    With a duration (seconds, None for no limit), the watchdog stops it
+    at the latest that long after it was started, or last renewed.
+    """
+
+    def __init__(self, lirc, remote, command, duration=None):
+        self.lirc = lirc
+        self.remote = remote
+        self.command = command
+        self._lock = threading.Lock()
+        self._active = True
+        self.expires = None
+        self.stopped_by = None
+        self.renew(duration)
+
+    @property
+    def active(self):
+        """True until the repeat has been stopped."""
+        return self._active
+
+    @property
+    def remaining(self):
+        """Seconds until expiry; None without a duration."""
+        return None if self.expires is None \
+            else max(0.0, self.expires - _now())
+
+    def renew(self, duration):
+        """
+        Sets the expiry to duration seconds from now (None for no limit).
+        Returns False if the lease has ended already.
+        """
+        with self._lock:
+            if not self._active:
+                return False
+            self.expires = None if duration is None else _now() + duration
+        WATCHDOG.watch(self)
+        return True
+
+    def stop(self):
+        """
+        Stops the repeat (over the connection of the lease, or a new one
+        if that fails), unless it has ended already. Throws
+        LircServerException if lircd refuses.
+        """
+        if self._end('stop'):
+            self.lirc.stop_ir(self.remote, self.command)
+
+    def _end(self, reason):
+        """Marks the lease as ended; True if it was active."""
+        with self._lock:
+            if not self._active:
+                return False
+            self._active = False
+            self.stopped_by = reason
+        WATCHDOG.forget(self)
+        return True
+
+    def _expire(self, reason):
+        """Called by the watchdog: stops over a separate connection."""
+        if self._end(reason):
+            self.lirc._stop_out_of_band(self.remote, self.command)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def __repr__(self):
+        return "RepeatLease({0!r}, {1!r}, {2})".format(
+            self.remote, self.command,
+            "active" if self._active else "stopped by " + self.stopped_by)
+
+
+class _Watchdog(object):
+    """
+    Thread stopping the leases on expiry, and all active leases at
+    interpreter exit. Started with the first lease.
+    """
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._heap = []
+        self._leases = set()
+        self._sequence = itertools.count()
+        self._thread = None
+
+    def watch(self, lease):
+        """Registers a lease, or its new expiry."""
+        with self._condition:
+            self._leases.add(lease)
+            if lease.expires is not None:
+                heapq.heappush(self._heap, (lease.expires,
+                                            next(self._sequence), lease))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run,
+                                                name='lirconian-watchdog')
+                self._thread.daemon = True
+                self._thread.start()
+                atexit.register(self.stop_all)
+            self._condition.notify()
+
+    def forget(self, lease):
+        """Unregisters an ended lease."""
+        with self._condition:
+            self._leases.discard(lease)
+
+    def active(self):
+        """Returns a list of the active leases."""
+        with self._condition:
+            return list(self._leases)
+
+    def stop_all(self, reason='exit'):
+        """Stops all active leases."""
+        for lease in self.active():
+            try:
+                lease._expire(reason)
+            except Exception:  # pylint: disable=broad-except
+                pass
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    heap = self._heap
+                    while heap and (heap[0][2] not in self._leases
+                                    or heap[0][2].expires != heap[0][0]):
+                        heapq.heappop(heap)     # ended, or renewed
+                    timeout = None if not heap else heap[0][0] - _now()
+                    if timeout is not None and timeout <= 0:
+                        lease = heapq.heappop(heap)[2]
+                        break
+                    self._condition.wait(timeout)
+            try:
+                lease._expire('expiry')
+            except Exception:  # pylint: disable=broad-except
+                pass
+
+
+WATCHDOG = _Watchdog()
@@ -0,0 +1,152 @@
+# Copyright (C) 2017 Bengt Martensson.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see http://www.gnu.org/licenses/.
+
+"""
+Buffered line reader for the socket to the Lirc server.
+"""
+
+import socket
+
+DEFAULT_CHUNK_SIZE = 4096
+
+
+class LineReader(object):
+    """
+    Splits the byte stream from a socket into lines.
+
+    Data is received with recv_into directly into a preallocated buffer.
+    Every byte is scanned for newline only once, and all the complete
+    lines in a chunk are extracted at once; only the trailing incomplete
+    line is moved when the buffer is compacted. The cost is thus linear
+    in the amount of data, also for very long replies. The complete lines
+    are kept in a list with a read position, so that a parser may
+    consume them in place (feed_parser), also when many pipelined replies
+    are buffered at once.
+    """
+
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        self._chunk_size = chunk_size
+        self._buffer = bytearray(2 * chunk_size)
+        self._start = 0     # start of the first incomplete line
+        self._end = 0       # end of the received data
+        self._lines = []
+        self._first = 0     # index of the first unread line
+
+    @property
+    def chunk_size(self):
+        """The maximal number of bytes read by one recv call."""
+        return self._chunk_size
+
+    @chunk_size.setter
+    def chunk_size(self, chunk_size):
+        self._chunk_size = chunk_size
+
+    @property
+    def has_line(self):
+        """True if a complete line is available without reading."""
+        return self._first < len(self._lines)
+
+    def readline(self, sock):
+        """
+        Returns the next line (without line terminator) as bytes,
+        reading from the socket as needed.
+        """
+        while not self.has_line:
+            if not self.fill(sock):
+                raise socket.error("Connection closed by the Lirc server")
+        line = self._lines[self._first]
+        self._advance(self._first + 1)
+        return line
+
+    def pop_lines(self):
+        """Returns, and removes, all complete lines read so far."""
+        lines = self._lines[self._first:]
+        self._lines = []
+        self._first = 0
+        return lines
+
+    def unread(self, lines):
+        """Puts lines, as obtained from pop_lines, back in front."""
+        self._lines[:self._first] = lines
+        self._first = 0
+
+    def feed_parser(self, parser):
+        """
+        Feeds the lines read so far to parser.feed_lines, which stops at
+        the end of its reply. Returns the list of the lines consumed.
+        """
+        start = self._first
+        end = parser.feed_lines(self._lines, start)
+        consumed = self._lines[start:end]
+        self._advance(end)
+        return consumed
+
+    def _advance(self, first):
+        """Marks the lines before index first as read."""
+        if first >= len(self._lines):
+            self._lines = []
+            first = 0
+        elif first > 1024 and 2 * first > len(self._lines):
+            del self._lines[:first]
+            first = 0
+        self._first = first
+
+    def fill(self, sock):
+        """
+        Reads one chunk from the socket, and extracts the complete lines
+        therein. Returns the number of bytes read, 0 on end of file.
+        """
+        if len(self._buffer) - self._end < self._chunk_size:
+            self._compact()
+        count = sock.recv_into(memoryview(self._buffer)[self._end:],
+                               self._chunk_size)
+        self._split(self._end + count)
+        return count
+
+    def feed(self, data):
+        """
+        Adds data, received by other means than fill,
+        and extracts the complete lines therein.
+        """
+        if len(self._buffer) - self._end < len(data):
+            self._compact(len(data))
+        self._buffer[self._end:self._end + len(data)] = data
+        self._split(self._end + len(data))
+
+    def _split(self, end):
+        buf = self._buffer
+        start = self._start
+        pos = buf.find(b'\n', self._end, end)
+        while pos >= 0:
+            self._lines.append(bytes(buf[start:pos]))
+            start = pos + 1
+            pos = buf.find(b'\n', start, end)
+        self._start = start
+        self._end = end
+
+    def _compact(self, needed=None):
+        """
+        Moves the incomplete line to the start of the buffer,
+        and grows the buffer if there is still not room for needed bytes.
+        """
+        needed = needed or self._chunk_size
+        remaining = self._end - self._start
+        if self._start > 0:
+            self._buffer[:remaining] = self._buffer[self._start:self._end]
+            self._start = 0
+            self._end = remaining
+        missing = remaining + needed - len(self._buffer)
+        if missing > 0:
+            self._buffer.extend(bytearray(max(missing, len(self._buffer))))
@@ -0,0 +1,309 @@
+# Copyright (C) 2017 Bengt Martensson.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see http://www.gnu.org/licenses/.
+
+"""
+Local parser for lircd.conf files, and an indexed database of the codes.
+
+Only the information needed for the catalog is extracted: the names of
+the remotes, and the names and (first) codes of their commands; for raw
+remotes, the code is 0, as reported by lircd. Include directives, and
+directories like lircd.conf.d (all *.conf files therein) are followed.
+
+The database can be kept in a cache file; it is reused as long as none
+of the configuration files or directories read has been modified.
+
+Usage:
+    database = load_database('/etc/lirc/lircd.conf.d', cache_path)
+    database.get_commands('sony', include_codes=True)
+    database.lookup(0xa90)
+"""
+
+import glob
+import marshal
+import os
+import sys
+
+from . import LircServerException
+
+# Format version of the cache file; increase on incompatible changes.
+# The marshal format may change between Python versions.
+_CACHE_VERSION = (1,) + tuple(sys.version_info[:2])
+
+
+class LircdConfError(ValueError):
+    """Thrown for unparseable lircd.conf files."""
+    pass
+
+
+class CodeDatabase(object):
+    """
+    The remotes and their commands from lircd.conf, indexed by name and by
+    code. The methods get_remotes, get_commands, has_remote, and
+    has_command mirror those of AbstractLirconian.
+    """
+
+    def __init__(self, remotes=None, sources=None):
+        """
+        The argument remotes is a list of (remote name, list of
+        (command name, code)), sources a list of (path, mtime, size)
+        of the files it was read from.
+        """
+        self._remotes = []
+        self._commands = {}
+        self._by_code = None
+        self.sources = list(sources or [])
+        for name, commands in remotes or []:
+            self.add_remote(name, commands)
+
+    def add_remote(self, name, commands):
+        """
+        Adds a remote, a list of (command name, code).
+        Like lircd, the first definition of a name is used.
+        """
+        self._add_columns(name, [command for command, _ in commands],
+                          [code for _, code in commands])
+
+    def _add_columns(self, name, names, codes):
+        """Adds a remote, given as a list of names and one of codes."""
+        if name in self._commands:
+            return
+        # Reversed, so that the first definition of a command wins.
+        index = dict(zip(reversed(names), reversed(codes)))
+        if len(index) < len(names):
+            seen = set()
+            keep = [i for i, command in enumerate(names)
+                    if not (command in seen or seen.add(command))]
+            names = [names[i] for i in keep]
+            codes = [codes[i] for i in keep]
+        self._remotes.append(name)
+        self._commands[name] = (names, codes, index)
+        self._by_code = None
+
+    def __len__(self):
+        return len(self._remotes)
+
+    def get_remotes(self):
+        """Returns a list of the names of the remotes."""
+        return list(self._remotes)
+
+    def get_commands(self, remote, include_codes=False):
+        """
+        Returns a list of the commands of the remote; with include_codes,
+        formatted like lircd does. Throws LircServerException (like
+        lircd) if the remote is unknown.
+        """
+        names, codes, _ = self._remote(remote)
+        if include_codes:
+            return ['{0:016x} {1}'.format(code, command)
+                    for command, code in zip(names, codes)]
+        return list(names)
+
+    def has_remote(self, remote):
+        """Returns True if the remote is known."""
+        return remote in self._commands
+
+    def has_command(self, remote, command):
+        """Returns True if the command of the remote is known."""
+        return remote in self._commands \
+            and command in self._commands[remote][2]
+
+    def code(self, remote, command):
+        """Returns the code of the command, None if it is unknown."""
+        return self._remote(remote)[2].get(command)
+
+    def lookup(self, code, remote=None):
+        """
+        Returns a list of (remote, command) having the code,
+        only from the given remote if not None.
+        """
+        if self._by_code is None:
+            self._by_code = {}
+            for name in self._remotes:
+                names, codes, _ = self._commands[name]
+                for command, command_code in zip(names, codes):
+                    self._by_code.setdefault(command_code, []) \
+                        .append((name, command))
+        matches = self._by_code.get(code, [])
+        return [match for match in matches
+                if remote is None or match[0] == remote]
+
+    def _remote(self, remote):
+        try:
+            return self._commands[remote]
+        except KeyError:
+            raise LircServerException('unknown remote: "{0}"'.format(remote))
+
+    def is_current(self):
+        """True if none of the source files has been modified."""
+        return all(_signature(path) == (mtime, size)
+                   for path, mtime, size in self.sources)
+
+    def save(self, cache_path):
+        """Writes the database to a cache file (atomically)."""
+        directory = os.path.dirname(cache_path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        data = (_CACHE_VERSION, self.sources,
+                [(name,) + self._commands[name][:2] for name in self._remotes])
+        temporary = cache_path + '.tmp{0}'.format(os.getpid())
+        with open(temporary, 'wb') as cache:
+            marshal.dump(data, cache)
+        os.rename(temporary, cache_path)
+
+    @classmethod
+    def load(cls, cache_path):
+        """
+        Reads a database from a cache file. Returns None if the file is
+        missing, unreadable, or of another format version.
+        """
+        try:
+            with open(cache_path, 'rb') as cache:
+                version, sources, remotes = marshal.loads(cache.read())
+        except Exception:  # pylint: disable=broad-except
+            return None
+        if version != _CACHE_VERSION:
+            return None
+        database = cls(sources=sources)
+        for name, names, codes in remotes:
+            database._add_columns(name, names, codes)
+        return database
+
+
+def load_database(path, cache_path=None):
+    """
+    Returns the CodeDatabase of the lircd.conf file, or directory,
+    path. If cache_path is given, the database is read from there if it
+    is current, otherwise it is parsed and saved there.
+    """
+    if cache_path is not None:
+        database = CodeDatabase.load(cache_path)
+        if database is not None and database.sources \
+                and database.sources[0][0] == os.path.abspath(path) \
+                and database.is_current():
+            return database
+    database = parse(path)
+    if cache_path is not None:
+        try:
+            database.save(cache_path)
+        except (IOError, OSError):
+            pass
+    return database
+
+
+def parse(path):
+    """Parses a lircd.conf file, or directory, returns a CodeDatabase."""
+    parser = _Parser()
+    parser.read(os.path.abspath(path))
+    return CodeDatabase(parser.remotes, parser.sources)
+
+
+def _signature(path):
+    try:
+        status = os.stat(path)
+    except OSError:
+        return None
+    return (status.st_mtime, status.st_size)
+
+
+def _parse_code(text):
+    """Parses a code like lircd (strtoull with base 0)."""
+    if text[:2] in ('0x', '0X'):
+        return int(text[2:], 16)
+    if len(text) > 1 and text[0] == '0':
+        return int(text[1:], 8)
+    return int(text)
+
+
+class _Parser(object):
+    """Reads lircd.conf files; collects remotes and the sources read."""
+
+    def __init__(self):
+        self.remotes = []
+        self.sources = []
+        self._seen = set()
+
+    def _add_source(self, path):
+        self.sources.append((path,) + _signature(path))
+
+    def read(self, path):
+        """Reads a file, or all *.conf files in a directory."""
+        if path in self._seen:
+            return
+        self._seen.add(path)
+        if os.path.isdir(path):
+            self._add_source(path)
+            for name in sorted(os.listdir(path)):
+                if name.endswith('.conf'):
+                    self.read(os.path.join(path, name))
+            return
+        with open(path, 'rb') as config:
+            self._add_source(path)
+            self._parse(path, config.read().decode('latin-1').splitlines())
+
+    def _include(self, path, words):
+        pattern = ' '.join(words[1:]).strip('"<>')
+        pattern = os.path.join(os.path.dirname(path), pattern)
+        directory = os.path.dirname(pattern)
+        if glob.has_magic(pattern) and os.path.isdir(directory):
+            self._add_source(directory)
+        for name in sorted(glob.glob(pattern)):
+            self.read(name)
+
+    def _parse(self, path, lines):
+        # pylint: disable=too-many-branches
+        remote = None
+        commands = None
+        section = None
+        for lineno, line in enumerate(lines, 1):
+            words = line.split('#', 1)[0].split()
+            if not words:
+                continue
+            keyword = words[0].lower()
+            try:
+                if keyword in ('begin', 'end') and len(words) == 2:
+                    what = words[1].lower()
+                    if keyword == 'begin' and what == 'remote':
+                        if remote is not None:
+                            raise LircdConfError("Nested remote")
+                        remote, commands, section = '', [], 'remote'
+                    elif remote is None:
+                        raise LircdConfError(
+                            "'{0}' outside of remote".format(line.strip()))
+                    elif keyword == 'begin' and what in ('codes',
+                                                         'raw_codes'):
+                        section = what
+                    elif keyword == 'end' and what == 'remote':
+                        if not remote:
+                            raise LircdConfError("Remote without name")
+                        self.remotes.append((remote, commands))
+                        remote, commands, section = None, None, None
+                    elif keyword == 'end':
+                        section = 'remote'
+                elif remote is None:
+                    if keyword == 'include':
+                        self._include(path, words)
+                elif section == 'remote':
+                    if keyword == 'name' and not remote and len(words) > 1:
+                        remote = words[1]
+                elif section == 'codes':
+                    if len(words) > 1:
+                        commands.append((words[0], _parse_code(words[1])))
+                elif section == 'raw_codes':
+                    if keyword == 'name' and len(words) > 1:
+                        commands.append((words[1], 0))
+            except (LircdConfError, ValueError) as ex:
+                raise LircdConfError("{0}:{1}: {2}".format(path, lineno, ex))
+        if remote is not None:
+            raise LircdConfError("{0}: unterminated remote".format(path))
@@ -0,0 +1,218 @@
+# Copyright (C) 2017 Bengt Martensson.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see http://www.gnu.org/licenses/.
+
+"""
+Timed macros: sequences of key presses with precise timing.
+
+A macro is written one step per line; # starts a comment:
+
+    remote tv                   # remote for the following keys
+    gap 300ms                   # default gap after each key
+    KEY_1                       # press KEY_1 once
+    KEY_2 count=3 gap=1s        # send KEY_2 three times, then wait 1 s
+    KEY_VOLUMEUP hold=1500ms    # hold KEY_VOLUMEUP for 1.5 s
+    amp:KEY_MUTE                # key from another remote
+    wait 2s                     # pause
+
+Durations are given in seconds, with an optional unit s or ms.
+The gap is counted from the completion of a key to the start of the next.
+Timing uses a monotonic clock; the last part of each wait is spent
+spinning, for precision.
+"""
+
+import math
+import time
+
+from .catalog import _now
+
+# The final part of a wait, in seconds, that is spent spinning.
+_SPIN = 0.002
+
+# Time in seconds after the end of a hold, after which the watchdog
+# stops the repeat, if the macro has not (see lease.RepeatLease).
+HOLD_MARGIN = 1.0
+
+
+class MacroError(ValueError):
+    """Thrown for syntax errors in macros, and for unknown names."""
+    pass
+
+
+class MacroStep(object):
+    """
+    A step of a macro: either a key press (remote, command, count, hold,
+    gap) or, if command is None, a pause of wait seconds.
+    """
+
+    __slots__ = ('remote', 'command', 'count', 'hold', 'gap', 'wait')
+
+    def __init__(self, remote=None, command=None, count=1, hold=None,
+                 gap=0.0, wait=None):
+        self.remote = remote
+        self.command = command
+        self.count = count
+        self.hold = hold
+        self.gap = gap
+        self.wait = wait
+
+    def __repr__(self):
+        if self.command is None:
+            return "MacroStep(wait={0!r})".format(self.wait)
+        return "MacroStep({0!r}, {1!r}, count={2!r}, hold={3!r}, gap={4!r})" \
+            .format(self.remote, self.command, self.count, self.hold,
+                    self.gap)
+
+
+def parse_duration(text):
+    """Parses a duration like "300ms", "1.5s" or "2", returns seconds."""
+    try:
+        if text.endswith('ms'):
+            value = float(text[:-2]) / 1000
+        elif text.endswith('s'):
+            value = float(text[:-1])
+        else:
+            value = float(text)
+    except ValueError:
+        raise MacroError("Invalid duration: " + text)
+    if math.isinf(value) or math.isnan(value):
+        raise MacroError("Invalid duration: " + text)
+    if value < 0:
+        raise MacroError("Negative duration: " + text)
+    return value
+
+
+def parse_macro(lines, remote=None, gap=0.0):
+    """
+    Parses a macro, given as an iterable of lines, or as one string.
+    The remote and the gap are the initial defaults.
+    Returns a Macro.
+    """
+    if isinstance(lines, str):
+        lines = lines.splitlines()
+    steps = []
+    for lineno, line in enumerate(lines, 1):
+        words = line.split('#', 1)[0].split()
+        if not words:
+            continue
+        try:
+            if words[0] in ('remote', 'gap', 'wait'):
+                if len(words) != 2:
+                    raise MacroError("Expected one argument")
+                if words[0] == 'remote':
+                    remote = words[1]
+                elif words[0] == 'gap':
+                    gap = parse_duration(words[1])
+                else:
+                    steps.append(MacroStep(wait=parse_duration(words[1])))
+                continue
+            steps.append(_parse_key(words, remote, gap))
+        except MacroError as ex:
+            raise MacroError("line {0}: {1}".format(lineno, ex))
+    return Macro(steps)
+
+
+def _parse_key(words, remote, gap):
+    key_remote, _, command = words[0].rpartition(':')
+    step = MacroStep(key_remote or remote, command, gap=gap)
+    if not step.remote:
+        raise MacroError("No remote given for " + command)
+    for option in words[1:]:
+        name, _, value = option.partition('=')
+        if name == 'count':
+            try:
+                step.count = int(value)
+            except ValueError:
+                raise MacroError("Invalid count: " + value)
+            if step.count < 1:
+                raise MacroError("Invalid count: " + value)
+        elif name == 'hold':
+            step.hold = parse_duration(value)
+        elif name == 'gap':
+            step.gap = parse_duration(value)
+        else:
+            raise MacroError("Unknown option: " + option)
+    if step.hold is not None and step.count != 1:
+        raise MacroError("count and hold cannot be combined")
+    return step
+
+
+def sleep_until(deadline, clock=_now, sleep=time.sleep):
+    """
+    Waits until the clock reaches deadline; sleeps for most of the
+    time and spins for the last _SPIN seconds.
+    """
+    while True:
+        remaining = deadline - clock()
+        if remaining <= 0:
+            return
+        if remaining > _SPIN:
+            sleep(remaining - _SPIN)
+
+
+class Macro(object):
+    """A sequence of MacroSteps, executable over a Lirconian."""
+
+    def __init__(self, steps):
+        self.steps = list(steps)
+
+    def __len__(self):
+        return len(self.steps)
+
+    def validate(self, lirc):
+        """
+        Checks that all the remotes and commands are known to the Lirc
+        server, by fetching the command list of each remote once
+        (no communication at all if its catalog cache is enabled).
+        Throws MacroError listing the unknown names.
+        """
+        remotes = set(lirc.get_remotes())
+        commands = {}
+        unknown = []
+        for step in self.steps:
+            if step.command is None:
+                continue
+            if step.remote not in remotes:
+                unknown.append(step.remote)
+                continue
+            if step.remote not in commands:
+                commands[step.remote] = set(lirc.get_commands(step.remote))
+            if step.command not in commands[step.remote]:
+                unknown.append(step.remote + ":" + step.command)
+        if unknown:
+            raise MacroError("Unknown remotes or commands: "
+                             + ", ".join(sorted(set(unknown))))
+
+    def run(self, lirc, validate=True):
+        """
+        Executes the macro over the (open) Lirconian lirc,
+        after validating the names, unless validate is False.
+        """
+        if validate:
+            self.validate(lirc)
+        start = _now()
+        for step in self.steps:
+            sleep_until(start)
+            if step.command is None:
+                start = _now() + step.wait
+                continue
+            if step.hold is None:
+                lirc.send_ir_command(step.remote, step.command, step.count)
+            else:
+                pressed = _now()
+                # The lease stops the repeat, even if this thread is stuck.
+                with lirc.lease_repeat(step.remote, step.command,
+                                       step.hold + HOLD_MARGIN):
+                    sleep_until(pressed + step.hold)
+            start = _now() + step.gap
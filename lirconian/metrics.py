@@ -0,0 +1,189 @@
+# Copyright (C) 2017 Bengt Martensson.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see http://www.gnu.org/licenses/.
+
+"""
+Latency instrumentation of the commands sent to the Lirc server.
+
+A timing hook is a callable, registered with add_timing_hook() of a
+Lirconian, that is called with a CommandTiming after every command.
+LatencyMetrics is such a hook, collecting a latency histogram per
+lircd verb (SEND_ONCE, LIST, ...), from which percentiles are computed.
+
+The time to the first byte of the reply is mostly the work of lircd and
+the IR driver (a SEND_ONCE is answered after the transmission); the
+remainder of the latency is spent transferring and parsing the reply.
+"""
+
+from __future__ import print_function
+import math
+import threading
+
+
+class CommandTiming(object):
+    """
+    Timing of one command. The times are from a monotonic clock, in
+    seconds: started (before sending), first_byte (the first byte of the
+    reply available), completed (reply parsed, or failure).
+    The status is "SUCCESS", "ERROR", or the name of the exception
+    that terminated the command, like "TimeoutError".
+    """
+
+    __slots__ = ('verb', 'packet', 'started', 'first_byte', 'completed',
+                 'bytes_sent', 'bytes_received', 'status')
+
+    def __init__(self, packet, started):
+        self.verb = packet.split(' ', 1)[0]
+        self.packet = packet
+        self.started = started
+        self.first_byte = None
+        self.completed = None
+        self.bytes_sent = len(packet) + 1
+        self.bytes_received = 0
+        self.status = None
+
+    @property
+    def latency(self):
+        """Total time of the command, in seconds."""
+        return self.completed - self.started
+
+    @property
+    def time_to_first_byte(self):
+        """Time until the reply started to arrive, None if it did not."""
+        return None if self.first_byte is None \
+            else self.first_byte - self.started
+
+    def __repr__(self):
+        return "CommandTiming({0!r}, {1}, latency={2:.6f})".format(
+            self.packet, self.status, self.latency)
+
+
+class LatencyHistogram(object):
+    """
+    Histogram with logarithmic buckets, growing by the factor growth,
+    starting at resolution seconds. Percentiles are thus exact within
+    the bucket width (default about 9%); memory is independent of the
+    number of samples.
+    """
+
+    def __init__(self, resolution=1e-6, growth=2 ** 0.125):
+        self._resolution = resolution
+        self._log_growth = math.log(growth)
+        self._growth = growth
+        self._buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+
+    def add(self, value):
+        """Adds a sample, in seconds."""
+        index = 0 if value <= self._resolution else \
+            int(math.log(value / self._resolution) / self._log_growth) + 1
+        self._buckets[index] = self._buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+
+    @property
+    def mean(self):
+        """The mean of the samples, None if there are none."""
+        return self.total / self.count if self.count else None
+
+    def percentile(self, percent):
+        """
+        Returns the upper bound of the bucket containing the given
+        percentile (0-100), clamped to the extreme samples;
+        None if there are no samples.
+        """
+        if not self.count:
+            return None
+        rank = max(1, int(math.ceil(self.count * percent / 100.0)))
+        seen = 0
+        for index in sorted(self._buckets):
+            seen += self._buckets[index]
+            if seen >= rank:
+                bound = self._resolution * self._growth ** index
+                return min(max(bound, self.minimum), self.maximum)
+        return self.maximum
+
+
+class LatencyMetrics(object):
+    """
+    Timing hook collecting, per verb, histograms of the latency and of
+    the time to the first byte, byte counts, and the count per status.
+    Thread-safe, so it may be shared by several connections.
+    """
+
+    PERCENTILES = (50, 90, 99)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.verbs = {}
+
+    def __call__(self, timing):
+        with self._lock:
+            stats = self.verbs.get(timing.verb)
+            if stats is None:
+                stats = self.verbs[timing.verb] = _VerbStatistics()
+            stats.add(timing)
+
+    def report(self, out):
+        """Prints a summary, one line per verb, times in milliseconds."""
+        print("{0:<17} {1:>6} {2:>6} {3:>8} {4:>8} {5:>8} {6:>8} {7:>8} "
+              "{8:>9} {9:>9}".format(
+                  "verb", "count", "errors", "ttfb-p50", "p50", "p90",
+                  "p99", "max", "bytes-out", "bytes-in"), file=out)
+        with self._lock:
+            for verb in sorted(self.verbs):
+                stats = self.verbs[verb]
+                print("{0:<17} {1:>6} {2:>6} {3:>8} {4:>8} {5:>8} {6:>8} "
+                      "{7:>8} {8:>9} {9:>9}".format(
+                          verb, stats.latency.count, stats.errors,
+                          _milliseconds(stats.first_byte.percentile(50)),
+                          *([_milliseconds(stats.latency.percentile(p))
+                             for p in self.PERCENTILES]
+                            + [_milliseconds(stats.latency.maximum),
+                               stats.bytes_sent, stats.bytes_received])),
+                      file=out)
+
+
+class _VerbStatistics(object):
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.first_byte = LatencyHistogram()
+        self.statuses = {}
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    @property
+    def errors(self):
+        """Number of commands not succeeding."""
+        return self.latency.count - self.statuses.get('SUCCESS', 0)
+
+    def add(self, timing):
+        """Adds a CommandTiming."""
+        self.latency.add(timing.latency)
+        if timing.first_byte is not None:
+            self.first_byte.add(timing.time_to_first_byte)
+        self.statuses[timing.status] = self.statuses.get(timing.status, 0) + 1
+        self.bytes_sent += timing.bytes_sent
+        self.bytes_received += timing.bytes_received
+
+
+def _milliseconds(seconds):
+    return "-" if seconds is None else "{0:.3f}".format(seconds * 1000)
@@ -0,0 +1,439 @@
+# Copyright (C) 2017 Bengt Martensson.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see http://www.gnu.org/licenses/.
+
+"""
+Single-threaded engine driving many connections to Lirc servers.
+
+All sockets are non-blocking and watched by one selector (epoll, kqueue,
+...), so an idle connection costs a file descriptor and a few hundred
+bytes, but no thread. Each connection has its own read buffer
+(LineReader), incremental reply parser, output buffer, and queue of
+requests waiting for their replies. A request returns a
+concurrent.futures.Future, completed in the loop thread with the DATA
+lines of the reply, or with a LircServerException (or a connection
+error); a callback may also be given. Button events and SIGHUP
+announcements are delivered to per-connection callbacks.
+
+Usage:
+    mux = LircMultiplexer()
+    lirc = mux.tcp('livingroom', on_event=print)
+    lirc.send_ir_command('tv', 'KEY_POWER').add_done_callback(...)
+    mux.run()                    # until mux.stop()
+
+The methods may be called from any thread; calls from other threads
+than the one running the loop are handed to it.
+
+Requires Python 3.4 or later.
+"""
+
+import collections
+import errno
+import heapq
+import itertools
+import logging
+import os
+import selectors
+import socket
+import threading
+from concurrent.futures import Future
+
+from . import AbstractLirconian, LircServerException, DEFAULT_PORT
+from .catalog import _now
+from .events import parse_event
+from .line_reader import LineReader
+from .reply_parser import FastReplyParser, BadPacketException
+
+# Smaller than for AbstractLirconian, since most connections are idle.
+DEFAULT_CHUNK_SIZE = 1024
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class LircMultiplexer(object):
+    """
+    Selector loop driving any number of MultiplexedConnections.
+    Requests not answered within the timeout of their connection fail
+    with socket.timeout, and close the connection.
+    """
+
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.connections = set()
+        self._selector = selectors.DefaultSelector()
+        self._wakeup_in, self._wakeup_out = socket.socketpair()
+        self._wakeup_in.setblocking(False)
+        self._wakeup_out.setblocking(False)
+        self._selector.register(self._wakeup_in, selectors.EVENT_READ)
+        self._calls = collections.deque()
+        self._deadlines = []
+        self._sequence = itertools.count()
+        self._loop_thread = None
+        self._stopping = False
+
+    def unix(self, path, **kwargs):
+        """
+        Returns a new MultiplexedConnection to lircd on the Unix domain
+        socket path. The keyword arguments are those of
+        MultiplexedConnection.
+        """
+        return self._open(socket.AF_UNIX, path, kwargs)
+
+    def tcp(self, address='localhost', port=DEFAULT_PORT, **kwargs):
+        """
+        Returns a new MultiplexedConnection to lircd on TCP address:port.
+        The name is resolved at once (blocking); the connection is
+        established by the loop.
+        """
+        family, _, _, _, sockaddr = socket.getaddrinfo(
+            address, port, 0, socket.SOCK_STREAM)[0]
+        return self._open(family, sockaddr, kwargs)
+
+    def _open(self, family, sockaddr, kwargs):
+        connection = MultiplexedConnection(self, family, sockaddr, **kwargs)
+        self.call(connection._connect)
+        return connection
+
+    def call(self, function, *args):
+        """
+        Calls function(*args) in the loop thread: at once if called
+        from it, or if the loop is not running, otherwise as soon as
+        the loop gets to it.
+        """
+        if self._loop_thread is None \
+                or self._loop_thread == threading.current_thread():
+            function(*args)
+        else:
+            self._calls.append((function, args))
+            try:
+                self._wakeup_out.send(b'\0')
+            except socket.error:
+                pass                    # buffer full: a wakeup is pending
+
+    def run(self):
+        """Runs the loop until stop() is called."""
+        self._stopping = False
+        self._loop_thread = threading.current_thread()
+        try:
+            while not self._stopping:
+                self.run_once(None)
+        finally:
+            self._loop_thread = None
+
+    def run_once(self, timeout=0):
+        """
+        Waits at most timeout seconds (forever if None) for input, output,
+        or the next request timeout, and handles everything ready.
+        (Other threads should only use the connections while run() is
+        running, not between calls of run_once.)
+        """
+        outermost = self._loop_thread is None
+        if outermost:
+            self._loop_thread = threading.current_thread()
+        try:
+            if self._deadlines:
+                remaining = max(0, self._deadlines[0][0] - _now())
+                timeout = remaining if timeout is None \
+                    else min(timeout, remaining)
+            for key, mask in self._selector.select(timeout):
+                connection = key.data
+                if connection is None:
+                    self._run_calls()
+                    continue
+                if mask & selectors.EVENT_WRITE:
+                    connection._on_writable()
+                if mask & selectors.EVENT_READ and connection.is_open:
+                    connection._on_readable()
+            self._run_calls()
+            self._expire()
+        finally:
+            if outermost:
+                self._loop_thread = None
+
+    def stop(self):
+        """Makes run() return, after the current iteration."""
+        def stop():
+            self._stopping = True
+        self.call(stop)
+
+    def close(self):
+        """Closes all connections, and the selector."""
+        for connection in list(self.connections):
+            connection.close()
+        self._selector.close()
+        self._wakeup_in.close()
+        self._wakeup_out.close()
+
+    def _run_calls(self):
+        try:
+            while self._wakeup_in.recv(4096):
+                pass
+        except socket.error:
+            pass
+        while self._calls:
+            function, args = self._calls.popleft()
+            function(*args)
+
+    def _add_deadline(self, deadline, connection, future):
+        heapq.heappush(self._deadlines, (deadline, next(self._sequence),
+                                         connection, future))
+
+    def _expire(self):
+        now = _now()
+        while self._deadlines and self._deadlines[0][0] <= now:
+            _, _, connection, future = heapq.heappop(self._deadlines)
+            if not future.done() and connection.is_open:
+                connection._close(socket.timeout(
+                    "No reply from the Lirc server within {0}s"
+                    .format(connection.timeout)))
+
+
+class MultiplexedConnection(object):
+    """
+    Connection to a Lirc server, driven by a LircMultiplexer.
+    The callbacks, called in the loop thread, are on_event(connection,
+    IrEvent) for button events, on_sighup(connection) when lircd has
+    reloaded its configuration, and on_close(connection, exception) when
+    the connection has been closed, exception being None for close().
+    An exception raised by a callback is logged, and otherwise ignored.
+    Requests fail if their reply has not arrived within timeout seconds
+    (None for no limit).
+    """
+
+    __slots__ = ('mux', 'address', 'timeout', 'on_event', 'on_sighup',
+                 'on_close', '_family', '_socket', '_connected', '_reader',
+                 '_parser', '_events', '_pending', '_output', '_mask',
+                 '__weakref__')
+
+    def __init__(self, mux, family, address, on_event=None, on_sighup=None,
+                 on_close=None, timeout=None):
+        self.mux = mux
+        self.address = address
+        self.timeout = timeout
+        self.on_event = on_event
+        self.on_sighup = on_sighup
+        self.on_close = on_close
+        self._family = family
+        self._socket = None
+        self._connected = False
+        self._reader = LineReader(mux.chunk_size)
+        self._events = []
+        self._parser = FastReplyParser(self._events)
+        self._pending = collections.deque()
+        self._output = bytearray()
+        self._mask = 0
+
+    @property
+    def is_open(self):
+        """True until the connection has been closed, or has failed."""
+        return self._socket is not None
+
+    @property
+    def pending(self):
+        """Number of requests waiting for their replies."""
+        return len(self._pending)
+
+    def send(self, packet, callback=None):
+        """
+        Sends a packet (like "VERSION"). Returns a Future, whose result
+        is the list of the DATA lines of the reply; callback, if given,
+        is called with the Future when it is done.
+        """
+        future = Future()
+        if callback is not None:
+            future.add_done_callback(callback)
+        self.mux.call(self._enqueue, packet, future)
+        return future
+
+    def send_ir_command(self, remote, command, count=1, callback=None):
+        """Transmits the command count times; see send."""
+        return self.send(
+            AbstractLirconian._send_once_packet(remote, command, count),
+            callback)
+
+    def send_ir_command_repeat(self, remote, command, callback=None):
+        """Starts transmitting the command; see send."""
+        return self.send("SEND_START " + remote + " " + command, callback)
+
+    def stop_ir(self, remote, command, callback=None):
+        """Stops transmitting the command; see send."""
+        return self.send("SEND_STOP " + remote + " " + command, callback)
+
+    def get_remotes(self, callback=None):
+        """Requests the list of remotes; see send."""
+        return self.send("LIST", callback)
+
+    def get_commands(self, remote, callback=None):
+        """
+        Requests the list of commands of the remote, with their codes,
+        like "0000000000000a90 KEY_POWER"; see send.
+        """
+        return self.send("LIST " + remote, callback)
+
+    def get_version(self, callback=None):
+        """Requests the version of the Lirc server; see send."""
+        return self.send("VERSION", callback)
+
+    def close(self):
+        """Closes the connection; the waiting requests fail."""
+        self.mux.call(self._close, None)
+
+    def _connect(self):
+        sock = socket.socket(self._family, socket.SOCK_STREAM)
+        if self._family == socket.AF_UNIX:
+            # Local, thus immediate, unless the listen queue is full.
+            try:
+                sock.connect(self.address)
+            except socket.error as ex:
+                sock.close()
+                self._socket = None
+                self._notify_close(ex)
+                return
+            sock.setblocking(False)
+            self._connected = True
+        else:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.setblocking(False)
+            error = sock.connect_ex(self.address)
+            if error not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+                sock.close()
+                self._notify_close(socket.error(error, os.strerror(error)))
+                return
+            self._connected = error == 0
+        self._socket = sock
+        self.mux.connections.add(self)
+        self._mask = self._wanted_mask()
+        self.mux._selector.register(sock, self._mask, self)
+
+    def _wanted_mask(self):
+        if not self._connected or self._output:
+            return selectors.EVENT_READ | selectors.EVENT_WRITE
+        return selectors.EVENT_READ
+
+    def _update_mask(self):
+        mask = self._wanted_mask()
+        if mask != self._mask:
+            self._mask = mask
+            self.mux._selector.modify(self._socket, mask, self)
+
+    def _enqueue(self, packet, future):
+        if self._socket is None:
+            future.set_exception(socket.error("Connection is closed"))
+            return
+        self._pending.append((packet, future))
+        self._output += (packet + '\n').encode('US-ASCII')
+        if self.timeout is not None:
+            self.mux._add_deadline(_now() + self.timeout, self, future)
+        if self._connected:
+            self._on_writable()
+
+    def _on_writable(self):
+        if not self._connected:
+            error = self._socket.getsockopt(socket.SOL_SOCKET,
+                                            socket.SO_ERROR)
+            if error:
+                self._close(socket.error(error, os.strerror(error)))
+                return
+            self._connected = True
+        if self._output:
+            try:
+                sent = self._socket.send(self._output)
+            except socket.error as ex:
+                if ex.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    sent = 0
+                else:
+                    self._close(ex)
+                    return
+            del self._output[:sent]
+        self._update_mask()
+
+    def _on_readable(self):
+        try:
+            if not self._reader.fill(self._socket):
+                self._close(socket.error(
+                    "Connection closed by the Lirc server"))
+                return
+        except socket.error as ex:
+            if ex.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                self._close(ex)
+            return
+        try:
+            for line in self._reader.pop_lines():
+                self._feed(line)
+        except BadPacketException as ex:
+            self._close(ex)
+
+    def _feed(self, line):
+        parser = self._parser
+        parser.feed(line)
+        if self._events:
+            try:
+                for event_line in self._events:
+                    event = parse_event(event_line)
+                    if event is not None:
+                        self._invoke(self.on_event, event)
+            finally:
+                del self._events[:]
+        if parser.sighup:
+            parser.sighup = False
+            self._invoke(self.on_sighup)
+        if not parser.is_completed:
+            return
+        self._parser = FastReplyParser(self._events)
+        if not self._pending:
+            raise BadPacketException("Unexpected reply to `{0}' received"
+                                     .format(parser.command))
+        packet, future = self._pending.popleft()
+        if parser.command != packet.strip():
+            raise BadPacketException(
+                "Reply to `{0}' received, expected reply to `{1}'"
+                .format(parser.command, packet))
+        if future.done():
+            return
+        if parser.success:
+            future.set_result(parser.data)
+        else:
+            future.set_exception(LircServerException(''.join(parser.data)))
+
+    def _close(self, exception):
+        if self._socket is None:
+            return
+        self.mux._selector.unregister(self._socket)
+        self._socket.close()
+        self._socket = None
+        self.mux.connections.discard(self)
+        pending, self._pending = self._pending, collections.deque()
+        for _, future in pending:
+            if not future.done():
+                future.set_exception(exception
+                                     or socket.error("Connection closed"))
+        self._notify_close(exception)
+
+    def _notify_close(self, exception):
+        self._invoke(self.on_close, exception)
+
+    def _invoke(self, callback, *args):
+        """
+        Calls the user callback, if any; an exception therein is logged,
+        rather than stopping the loop for all connections.
+        """
+        if callback is None:
+            return
+        try:
+            callback(self, *args)
+        except Exception:
+            _LOGGER.exception("Callback %r of %r failed", callback, self)
+
+    def __repr__(self):
+        return "MultiplexedConnection({0!r})".format(self.address)
@@ -0,0 +1,167 @@
+# Copyright (C) 2017 Bengt Martensson.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see http://www.gnu.org/licenses/.
+
+"""
+Resolution of approximate command names, like "vol up" or "volume+"
+for KEY_VOLUMEUP.
+
+A CommandIndex is built once from the command names of a remote; a name
+is then resolved by trying, in order:
+    exact:       the name itself,
+    case:        the name ignoring case,
+    normalized:  the name without KEY/BTN prefix, punctuation and case,
+                 with "+"/"-" read as up/down, and common abbreviations
+                 ("vol", "ch", ...) expanded,
+    prefix:      the unique command starting with the normalized name
+                 (if several do, the name is ambiguous and not resolved),
+    fuzzy:       the command sharing most character trigrams with it.
+The results are memoized, so repeated lookups are dictionary lookups.
+"""
+
+import bisect
+import re
+
+# Abbreviations expanded in normalized names.
+ALIASES = {
+    'vol': 'volume', 'ch': 'channel', 'chan': 'channel', 'pwr': 'power',
+    'plus': 'up', 'minus': 'down', 'prog': 'program', 'pg': 'page',
+    'fwd': 'forward', 'ff': 'fastforward', 'rew': 'rewind', 'rev': 'rewind',
+}
+
+# Maximal number of memoized lookups per index.
+MEMO_SIZE = 4096
+
+_TOKEN = re.compile(r'[a-z0-9]+|[+-]')
+
+
+def normalize(name):
+    """Returns the normalized form of a command name."""
+    tokens = _TOKEN.findall(name.lower())
+    if len(tokens) > 1 and tokens[0] in ('key', 'btn'):
+        del tokens[0]
+    words = []
+    for i, token in enumerate(tokens):
+        if token == '+':
+            words.append('up')
+        elif token == '-':
+            if i == len(tokens) - 1:
+                words.append('down')
+        else:
+            words.append(ALIASES.get(token, token))
+    return ''.join(words)
+
+
+def _trigrams(key):
+    padded = '$' + key + '$'
+    return set(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+class CommandIndex(object):
+    """
+    Index of the command names of one remote, for resolving approximate
+    names. Fuzzy matches need a similarity of at least cutoff (0 to 1).
+    """
+
+    def __init__(self, commands, cutoff=0.4):
+        self.commands = list(commands)
+        self.cutoff = cutoff
+        self._exact = set(self.commands)
+        self._folded = {}
+        self._normalized = {}
+        for command in self.commands:
+            self._folded.setdefault(command.lower(), command)
+            self._normalized.setdefault(normalize(command), command)
+        self._keys = sorted(self._normalized)
+        self._key_trigrams = [_trigrams(key) for key in self._keys]
+        self._by_trigram = {}
+        for i, trigrams in enumerate(self._key_trigrams):
+            for trigram in trigrams:
+                self._by_trigram.setdefault(trigram, []).append(i)
+        self._memo = {}
+
+    def __len__(self):
+        return len(self.commands)
+
+    def resolve(self, name):
+        """Returns the command best matching name, None if none does."""
+        return self.lookup(name)[0]
+
+    def lookup(self, name):
+        """
+        Returns (command, how), how being "exact", "case", "normalized",
+        "prefix", or "fuzzy"; (None, None) if nothing matches.
+        """
+        result = self._memo.get(name)
+        if result is None:
+            if len(self._memo) >= MEMO_SIZE:
+                self._memo.clear()
+            result = self._memo[name] = self._lookup(name)
+        return result
+
+    def resolve_many(self, names):
+        """
+        Resolves many names in one call.
+        Returns a list of the commands (None for unresolved names).
+        """
+        lookup = self.lookup
+        return [lookup(name)[0] for name in names]
+
+    def candidates(self, name, limit=5):
+        """
+        Returns up to limit (command, similarity) pairs, best first,
+        of the commands similar to name.
+        """
+        key = normalize(name)
+        return [(self._normalized[self._keys[i]], score)
+                for i, score in self._similar(key)[:limit]]
+
+    def _lookup(self, name):
+        if name in self._exact:
+            return (name, 'exact')
+        command = self._folded.get(name.lower())
+        if command is not None:
+            return (command, 'case')
+        key = normalize(name)
+        if not key:
+            return (None, None)
+        command = self._normalized.get(key)
+        if command is not None:
+            return (command, 'normalized')
+        start = bisect.bisect_left(self._keys, key)
+        end = bisect.bisect_right(self._keys, key + '\x7f', start)
+        if end - start == 1:
+            return (self._normalized[self._keys[start]], 'prefix')
+        if end - start > 1:
+            return (None, None)         # ambiguous, like "vol"
+        similar = self._similar(key)
+        if similar and similar[0][1] >= self.cutoff:
+            return (self._normalized[self._keys[similar[0][0]]], 'fuzzy')
+        return (None, None)
+
+    def _similar(self, key):
+        """
+        Returns a list of (key number, Dice similarity of the trigrams),
+        best first, of the keys sharing a trigram with key.
+        """
+        trigrams = _trigrams(key)
+        shared = {}
+        for trigram in trigrams:
+            for i in self._by_trigram.get(trigram, ()):
+                shared[i] = shared.get(i, 0) + 1
+        scores = [(i, 2.0 * count
+                   / (len(trigrams) + len(self._key_trigrams[i])))
+                  for i, count in shared.items()]
+        scores.sort(key=lambda score: (-score[1], score[0]))
+        return scores
@@ -0,0 +1,208 @@
+# Copyright (C) 2017 Bengt Martensson.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see http://www.gnu.org/licenses/.
+
+"""
+A pool of Lirconian connections, to be shared between threads.
+"""
+
+import contextlib
+import threading
+
+from . import UnixDomainSocketLirconian, TcpLirconian, \
+    DEFAULT_LIRC_DEVICE, DEFAULT_PORT, CONNECTION_ERRORS
+from .catalog import _now
+
+
+class PoolExhaustedException(Exception):
+    """Thrown if no connection became available within the timeout."""
+    pass
+
+
+class LirconianPool(object):
+    """
+    Keeps up to max_size connections to a Lirc server open, and hands them
+    out to threads. Before an idle connection is handed out, it is checked
+    (without sending anything) not to have been closed by the Lirc server,
+    for instance by a restart; if it has been idle for longer than
+    idle_check seconds, it is also probed with a VERSION command.
+    Broken connections are discarded and replaced by new ones.
+
+    Usage:
+        pool = LirconianPool.unix()
+        with pool.connection() as lirc:
+            lirc.send_ir_command(remote, command, 1)
+    or
+        pool.execute(lambda lirc: lirc.send_ir_command(remote, command, 1))
+    """
+
+    # Errors after which a connection is considered broken.
+    CONNECTION_ERRORS = CONNECTION_ERRORS
+
+    def __init__(self, factory, max_size=4, idle_check=30.0):
+        """
+        The argument factory is a callable without arguments,
+        returning a new, connected AbstractLirconian.
+        """
+        self._factory = factory
+        self._max_size = max_size
+        self._idle_check = idle_check
+        self._idle = []
+        self._size = 0
+        self._closed = False
+        self._condition = threading.Condition()
+
+    @classmethod
+    def unix(cls, socketAddress=DEFAULT_LIRC_DEVICE, verbose=False,
+             timeout=None, **kwargs):
+        """Returns a pool of UnixDomainSocketLirconians."""
+        return cls(lambda: UnixDomainSocketLirconian(socketAddress,
+                                                     verbose, timeout),
+                   **kwargs)
+
+    @classmethod
+    def tcp(cls, address="localhost", port=DEFAULT_PORT, verbose=False,
+            timeout=None, **kwargs):
+        """Returns a pool of TcpLirconians."""
+        return cls(lambda: TcpLirconian(address, port, verbose, timeout),
+                   **kwargs)
+
+    @property
+    def size(self):
+        """Number of connections currently open, idle or in use."""
+        return self._size
+
+    def acquire(self, timeout=None):
+        """
+        Returns a connection from the pool, opening a new one if none is idle
+        and the pool is not full. Otherwise waits at most timeout seconds
+        (forever if None) for a connection to be released.
+        Returns a (lirconian, reused) pair, where reused is True if the
+        connection has been used before.
+        """
+        deadline = None if timeout is None else _now() + timeout
+        while True:
+            with self._condition:
+                while True:
+                    if self._closed:
+                        raise PoolExhaustedException("Pool is closed")
+                    if self._idle:
+                        lirc, last_used = self._idle.pop()
+                        break
+                    if self._size < self._max_size:
+                        self._size += 1
+                        lirc = None
+                        break
+                    remaining = None if deadline is None \
+                        else deadline - _now()
+                    if remaining is not None and remaining <= 0:
+                        raise PoolExhaustedException(
+                            "No connection available within {0}s"
+                            .format(timeout))
+                    self._condition.wait(remaining)
+
+            # Connecting and checking is done without holding the lock.
+            if lirc is None:
+                break
+            if self._alive(lirc, last_used):
+                return lirc, True
+            self.release(lirc, True)
+        try:
+            return self._factory(), False
+        except Exception:
+            self._discard()
+            raise
+
+    def release(self, lirc, broken=False):
+        """
+        Returns a connection to the pool. If broken is True,
+        it is closed instead.
+        """
+        if broken or self._closed:
+            try:
+                lirc.close()
+            finally:
+                self._discard()
+            return
+        with self._condition:
+            self._idle.append((lirc, _now()))
+            self._condition.notify()
+
+    @contextlib.contextmanager
+    def connection(self, timeout=None):
+        """
+        Context manager handing out a connection. If a connection error
+        occurs within its block, the connection is discarded.
+        """
+        lirc = self.acquire(timeout)[0]
+        broken = False
+        try:
+            yield lirc
+        except self.CONNECTION_ERRORS:
+            broken = True
+            raise
+        finally:
+            self.release(lirc, broken)
+
+    def execute(self, function, timeout=None):
+        """
+        Calls function with a connection as argument, returns its result.
+        The function is not called again after an error, since its
+        commands may have been carried out already.
+        """
+        return self._call(function, self.acquire(timeout)[0])
+
+    def _call(self, function, lirc):
+        broken = False
+        try:
+            return function(lirc)
+        except self.CONNECTION_ERRORS:
+            broken = True
+            raise
+        finally:
+            self.release(lirc, broken)
+
+    def close(self):
+        """Closes all idle connections; busy ones are closed on release."""
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._condition.notify_all()
+        for lirc, _ in idle:
+            lirc.close()
+            self._discard()
+
+    def _alive(self, lirc, last_used):
+        """
+        True if the idle connection may be handed out. Reading what the
+        Lirc server has sent meanwhile detects a closed connection without
+        sending a command.
+        """
+        try:
+            lirc._poll_broadcasts()
+        except self.CONNECTION_ERRORS:
+            return False
+        return _now() - last_used < self._idle_check or self._probe(lirc)
+
+    def _probe(self, lirc):
+        try:
+            lirc.get_version()
+            return True
+        except Exception:  # pylint: disable=broad-except
+            return False
+
+    def _discard(self):
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
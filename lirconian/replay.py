@@ -0,0 +1,113 @@
+# Copyright (C) 2017 Bengt Martensson.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see http://www.gnu.org/licenses/.
+
+"""
+Offline replay of captured Lirc traffic (see lirconian.trace).
+
+The received lines of a capture are fed through a reply parser, and
+the replies are listed with their round trip times, as recorded.
+With --repeat, the parsing is repeated and timed, as a benchmark of the
+parser on real traffic.
+
+Usage:
+    python -m lirconian.replay [--parser fast] [--repeat n] capture.jsonl
+"""
+
+from __future__ import print_function
+import argparse
+import json
+import sys
+import timeit
+
+from .reply_parser import ReplyParser, FastReplyParser, BadPacketException
+
+PARSERS = {'reference': ReplyParser, 'fast': FastReplyParser}
+
+
+def read_capture(path):
+    """
+    Returns the records of a capture file,
+    as a list of (time, direction, line).
+    """
+    with open(path) as capture:
+        return [(record['time'], record['direction'], record['line'])
+                for record in (json.loads(line) for line in capture
+                               if line.strip())]
+
+
+def replay(records, parser_class=ReplyParser):
+    """
+    Feeds the received lines of records through parsers of the given
+    class. Returns a list of (parser, sent, received) of the completed
+    replies, where sent is the time the request was captured (None if
+    not found), and received the time the reply was completed.
+    Throws BadPacketException if the traffic is not parseable.
+    """
+    replies = []
+    sent = {}
+    parser = parser_class()
+    for time, direction, line in records:
+        if direction == 'out':
+            sent.setdefault(line.strip(), []).append(time)
+            continue
+        parser.feed(line)
+        if parser.is_completed:
+            requests = sent.get(parser.command)
+            replies.append((parser, requests.pop(0) if requests else None,
+                            time))
+            parser = parser_class()
+    return replies
+
+
+def main(argv=None):
+    """Replays a capture file from the command line."""
+    parser = argparse.ArgumentParser(
+        prog='lirconian.replay',
+        description='Replay captured Lirc traffic through a reply parser.')
+    parser.add_argument('-p', '--parser', choices=sorted(PARSERS),
+                        default='reference',
+                        help='Reply parser to use, default reference')
+    parser.add_argument('-r', '--repeat', type=int, default=0,
+                        help='Time this many passes of the parsing, '
+                        + 'instead of listing the replies')
+    parser.add_argument('capture', help='Capture file (JSON lines)')
+    args = parser.parse_args(argv)
+
+    records = read_capture(args.capture)
+    parser_class = PARSERS[args.parser]
+    try:
+        if args.repeat:
+            lines = sum(1 for record in records if record[1] == 'in')
+            seconds = timeit.timeit(lambda: replay(records, parser_class),
+                                    number=args.repeat)
+            print("{0}: {1} lines, {2:.1f} us per pass, {3:.0f} lines/s"
+                  .format(args.parser, lines, seconds / args.repeat * 1e6,
+                          lines * args.repeat / seconds))
+            return 0
+        for reply, sent, received in replay(records, parser_class):
+            print("{0:.6f} {1:>9} {2} {3} {4}".format(
+                received,
+                "-" if sent is None
+                else "{0:.3f}ms".format((received - sent) * 1000),
+                "SUCCESS" if reply.success else "ERROR",
+                reply.command, len(reply.data)))
+    except BadPacketException as ex:
+        print("Malformed packet in capture: {0}".format(ex), file=sys.stderr)
+        return 4
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -41,6 +41,8 @@ class ReplyParser(object):
        - data: List of lines, the command DATA payload.
        - sighup: boolean, reflects if SIGHUP package has been received
          (these are otherwise ignored)
+       - command: string, the command echoed by the server, identifying
+         the request the reply belongs to.
        - last_line: string, last input line (for error messages).
        - is_completed: True if no more input is required.
     '''
@@ -51,6 +53,7 @@ class ReplyParser(object):
         self.data = []
         self.last_line = ""
         self.sighup = False
+        self.command = None
         self._state = self._State.BEGIN
         self._lines_expected = None
         self._buffer = bytearray(0)
@@ -110,7 +113,12 @@ class ReplyParser(object):
     def _command(self, line):
         if not line:
             self._bad_packet_exception(line)
-        self._state = self._State.RESULT
+        elif line == "SIGHUP":
+            self._state = self._State.SIGHUP_END
+            self.sighup = True
+        else:
+            self.command = line
+            self._state = self._State.RESULT
 
     def _result(self, line):
         if line in ["SUCCESS", "ERROR"]:
@@ -155,3 +163,160 @@ class ReplyParser(object):
             self._state = self._State.BEGIN
         else:
             self._bad_packet_exception(line)
+
+
+class FastReplyParser(object):
+    '''
+    Drop-in replacement for ReplyParser with the same public accessors,
+    but working on raw bytes. Lines are dispatched through a precomputed
+    table, and only the DATA payload (and the command echo) is decoded,
+    lazily, when accessed. With feed_lines, the payload lines of a reply
+    are consumed in a tight loop.
+    Lines may be given as bytes or as strings.
+    If a list is given as the argument ignored, the lines outside of
+    packets (i.e. broadcast button events) are appended to it, as bytes.
+    '''
+
+    # pylint: disable=protected-access
+    _State = ReplyParser._State
+
+    def __init__(self, ignored=None):
+        self.ignored = ignored
+        self.result = Result.INCOMPLETE
+        self.success = None
+        self.sighup = False
+        self._state = 1
+        self._lines_expected = None
+        self._raw_data = []
+        self._data = None
+        self._last_line = b""
+        self._command = None
+
+    @property
+    def is_completed(self):
+        ''' Returns true if no more reply input is required. '''
+        return self.result is not Result.INCOMPLETE
+
+    @property
+    def data(self):
+        ''' List of lines, the command DATA payload. '''
+        if self._data is None or len(self._data) != len(self._raw_data):
+            self._data = [line.decode("US-ASCII") for line in self._raw_data]
+        return self._data
+
+    @property
+    def last_line(self):
+        ''' Last input line (for error messages). '''
+        return self._last_line.decode("US-ASCII")
+
+    @property
+    def command(self):
+        ''' The command echoed by the server. '''
+        return None if self._command is None \
+            else self._command.decode("US-ASCII")
+
+    def feed(self, line):
+        ''' Enter a line of data into parsing FSM, update state. '''
+        if not isinstance(line, bytes):
+            line = line.encode("US-ASCII")
+        line = line.strip()
+        if not line:
+            return
+        self._last_line = line
+        self._DISPATCH[self._state](self, line)
+        if self._state == 8:
+            self.result = Result.OK
+
+    def feed_lines(self, lines, start=0):
+        '''
+        Enter the lines from index start into the parser, until the reply
+        is complete. Returns the index of the first line not consumed.
+        '''
+        index = start
+        count = len(lines)
+        while index < count and self.result is Result.INCOMPLETE:
+            if self._state != 6:
+                self.feed(lines[index])
+                index += 1
+                continue
+            raw = self._raw_data
+            expected = self._lines_expected
+            while index < count and len(raw) < expected:
+                line = lines[index].strip()
+                index += 1
+                if line:
+                    raw.append(line)
+            if raw:
+                self._last_line = raw[-1]
+            if len(raw) >= expected:
+                self._state = 7
+        return index
+
+    ##
+    #  @defgroup FastFSM Internal parser FSM; states as in ReplyParser._State.
+    #  @{
+    #  pylint: disable=missing-docstring
+
+    def _bad_packet_exception(self, line):
+        raise BadPacketException(
+            "Cannot parse: %s\nat state: %s\n"
+            % (line.decode("US-ASCII"), self._State(self._state)))
+
+    def _begin(self, line):
+        if line == b"BEGIN":
+            self._state = 2
+        elif self.ignored is not None:
+            self.ignored.append(line)
+
+    def _command_line(self, line):
+        if line == b"SIGHUP":
+            self._state = 10
+            self.sighup = True
+        else:
+            self._command = line
+            self._state = 3
+
+    def _result(self, line):
+        if line == b"SUCCESS" or line == b"ERROR":
+            self.success = line == b"SUCCESS"
+            self._state = 4
+        elif line == b"SIGHUP":
+            self._state = 10
+            self.sighup = True
+        else:
+            self._bad_packet_exception(line)
+
+    def _data_line(self, line):
+        if line == b"END":
+            self._state = 8
+        elif line == b"DATA":
+            self._state = 5
+        else:
+            self._bad_packet_exception(line)
+
+    def _line_count(self, line):
+        try:
+            self._lines_expected = int(line)
+        except ValueError:
+            self._bad_packet_exception(line)
+        self._state = 7 if self._lines_expected == 0 else 6
+
+    def _lines(self, line):
+        self._raw_data.append(line)
+        if len(self._raw_data) >= self._lines_expected:
+            self._state = 7
+
+    def _end(self, line):
+        if line != b"END":
+            self._bad_packet_exception(line)
+        self._state = 8
+
+    def _sighup_end(self, line):
+        if line == b"END":
+            self._state = 1
+        else:
+            self._bad_packet_exception(line)
+
+    # Indexed by the values of ReplyParser._State.
+    _DISPATCH = (None, _begin, _command_line, _result, _data_line,
+                 _line_count, _lines, _end, None, None, _sighup_end)
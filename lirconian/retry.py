@@ -0,0 +1,60 @@
+# Copyright (C) 2017 Bengt Martensson.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see http://www.gnu.org/licenses/.
+
+"""
+Retry policies for the commands sent to the Lirc server.
+"""
+
+# Verbs that are always safe to repeat.
+IDEMPOTENT_VERBS = frozenset(['LIST', 'VERSION'])
+
+
+class RetryPolicy(object):
+    """
+    Decides which commands are retried after a connection error or a
+    malformed reply, how often, and how long to wait in between.
+
+    A command is attempted at most max_attempts times. Before attempt n+1,
+    the connection is reopened after a pause of
+    min(backoff * factor ** (n - 1), max_backoff) seconds.
+    Only commands whose verbs are in verbs are retried; per default
+    the idempotent LIST and VERSION. With retry_sends, SEND_ONCE is
+    retried too, with the risk that the signal is transmitted twice.
+    """
+
+    def __init__(self, max_attempts=3, backoff=0.05, factor=2.0,
+                 max_backoff=2.0, verbs=IDEMPOTENT_VERBS, retry_sends=False):
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.factor = factor
+        self.max_backoff = max_backoff
+        self.verbs = frozenset(verbs) | \
+            (frozenset(['SEND_ONCE']) if retry_sends else frozenset())
+
+    def retryable(self, packets):
+        """True if all the packets may be sent again."""
+        return all(packet.split(' ', 1)[0] in self.verbs
+                   for packet in packets)
+
+    def delay(self, attempt):
+        """The pause, in seconds, after the failed attempt (from 1)."""
+        return min(self.backoff * self.factor ** (attempt - 1),
+                   self.max_backoff)
+
+    def __repr__(self):
+        return "RetryPolicy(max_attempts={0!r}, backoff={1!r}, " \
+            "factor={2!r}, max_backoff={3!r}, verbs={4!r})".format(
+                self.max_attempts, self.backoff, self.factor,
+                self.max_backoff, sorted(self.verbs))
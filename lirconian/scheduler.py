@@ -0,0 +1,365 @@
+# Copyright (C) 2017 Bengt Martensson.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see http://www.gnu.org/licenses/.
+
+"""
+Prioritized, rate-limited admission of the commands to a Lirc server.
+
+A CommandScheduler decides, for all connections and threads using it,
+which command goes next: the waiting command of the highest priority
+class, and among those the oldest. Key presses (INTERACTIVE) thus
+overtake configuration commands (CONTROL), which overtake catalog
+queries (BACKGROUND). At most max_in_flight commands are executed at
+once, and the transmissions (SEND_ONCE, SEND_START) are limited by a
+token bucket to rate per second, with bursts of up to burst.
+
+Usage, with one scheduler per lircd:
+    scheduler = CommandScheduler.for_endpoint('/var/run/lirc/lircd',
+                                              rate=10, burst=5)
+    lirc.set_scheduler(scheduler)
+"""
+
+from __future__ import print_function
+import contextlib
+import heapq
+import itertools
+import threading
+
+from .catalog import _now
+from .metrics import LatencyHistogram, _milliseconds
+
+# The priority classes, most urgent first.
+INTERACTIVE = 0
+CONTROL = 1
+BACKGROUND = 2
+
+PRIORITY_NAMES = ('interactive', 'control', 'background')
+
+# Priority class of each verb; others are CONTROL.
+VERB_PRIORITIES = {
+    'SEND_ONCE': INTERACTIVE,
+    'SEND_START': INTERACTIVE,
+    'SEND_STOP': INTERACTIVE,
+    'LIST': BACKGROUND,
+    'VERSION': BACKGROUND,
+}
+
+# Verbs taking a token from the bucket. SEND_STOP does not,
+# not to delay the end of a transmission.
+RATE_LIMITED_VERBS = frozenset(['SEND_ONCE', 'SEND_START'])
+
+# Policies for a full queue.
+BLOCK = 'block'
+REJECT = 'reject'
+DROP = 'drop'
+
+_ENDPOINTS = {}
+_ENDPOINTS_LOCK = threading.Lock()
+
+
+class SchedulerFullException(Exception):
+    """
+    Thrown if a command is not accepted since the queue is full, or was
+    dropped from the queue in favor of a more urgent one.
+    """
+    pass
+
+
+class TokenBucket(object):
+    """
+    Token bucket holding up to burst tokens, refilled by rate per second.
+    Not thread-safe; the CommandScheduler serializes the access.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = _now()
+
+    def _refill(self):
+        now = _now()
+        self._tokens = min(self.burst,
+                           self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self, cost):
+        """
+        Returns the seconds until cost tokens (at most burst) are
+        available, 0 if they are.
+        """
+        self._refill()
+        missing = min(cost, self.burst) - self._tokens
+        return 0 if missing <= 0 else missing / self.rate
+
+    def take(self, cost):
+        """
+        Takes cost tokens. If there are not enough, the balance becomes
+        negative, delaying the following commands.
+        """
+        self._refill()
+        self._tokens -= cost
+
+
+class CommandScheduler(object):
+    """
+    Admits the commands to one Lirc server in priority order, with at
+    most max_in_flight executing at once, and the transmissions limited
+    to rate per second (None for no limit) with bursts of burst.
+
+    At most max_queue commands wait. If a command arrives at a full queue,
+    the policy decides: BLOCK waits for room, for at most timeout seconds
+    (forever if None); REJECT throws SchedulerFullException; DROP removes
+    the newest waiting command of the least urgent class, if that is less
+    urgent than the arriving one (its caller gets the exception),
+    and otherwise rejects the arriving command.
+
+    A thread already admitted (for example, by a composite operation)
+    is not queued again. Its transmissions take tokens only beyond those
+    already taken for it, so the packets of a composite operation should
+    be given to its admission: the rate limit is then waited for before
+    the admission, not while holding it.
+    """
+
+    def __init__(self, rate=None, burst=1, max_in_flight=1, max_queue=64,
+                 policy=BLOCK, timeout=None):
+        if policy not in (BLOCK, REJECT, DROP):
+            raise ValueError("Unknown policy: {0}".format(policy))
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.policy = policy
+        self.timeout = timeout
+        self._bucket = None if rate is None else TokenBucket(rate, burst)
+        self._condition = threading.Condition()
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._in_flight = 0
+        self._local = threading.local()
+        self._statistics = [_ClassStatistics() for _ in PRIORITY_NAMES]
+
+    @classmethod
+    def for_endpoint(cls, endpoint, **kwargs):
+        """
+        Returns the scheduler shared by all users of the endpoint (like a
+        socket path, or a (host, port) pair), creating it with the keyword
+        arguments if there is none yet.
+        """
+        with _ENDPOINTS_LOCK:
+            scheduler = _ENDPOINTS.get(endpoint)
+            if scheduler is None:
+                scheduler = _ENDPOINTS[endpoint] = cls(**kwargs)
+            return scheduler
+
+    @property
+    def depth(self):
+        """Number of commands waiting."""
+        return len(self._waiting)
+
+    @staticmethod
+    def classify(packets):
+        """Returns (priority class, number of tokens) for the packets."""
+        priority = BACKGROUND
+        cost = 0
+        for packet in packets:
+            verb = packet.split(' ', 1)[0]
+            priority = min(priority, VERB_PRIORITIES.get(verb, CONTROL))
+            if verb in RATE_LIMITED_VERBS:
+                cost += 1
+        return priority, cost
+
+    @contextlib.contextmanager
+    def admission(self, packets=(), priority=None):
+        """
+        Context manager waiting until the packets may be sent, which
+        should be done within its block. The priority class is that of
+        the most urgent packet, unless given.
+        """
+        packet_priority, cost = self.classify(packets)
+        if priority is None:
+            priority = packet_priority
+        if getattr(self._local, 'depth', 0):
+            prepaid = min(cost, self._local.prepaid)
+            self._local.prepaid -= prepaid
+            self._take_tokens(cost - prepaid)
+            self._local.depth += 1
+            try:
+                yield
+            finally:
+                self._local.depth -= 1
+            return
+
+        self._admit(priority, cost)
+        self._local.depth = 1
+        self._local.prepaid = cost
+        try:
+            yield
+        finally:
+            self._local.depth = 0
+            self._local.prepaid = 0
+            with self._condition:
+                self._in_flight -= 1
+                self._condition.notify_all()
+
+    def _admit(self, priority, cost):
+        statistics = self._statistics[priority]
+        queued = _now()
+        with self._condition:
+            if len(self._waiting) >= self.max_queue:
+                self._make_room(priority, statistics)
+            ticket = [priority, next(self._sequence), False, cost]
+            heapq.heappush(self._waiting, ticket)
+            statistics.enqueued()
+            self._condition.notify_all()
+            try:
+                self._wait_turn(ticket, cost)
+            except BaseException:
+                if not ticket[2]:
+                    self._waiting.remove(ticket)
+                    heapq.heapify(self._waiting)
+                    statistics.queued -= 1
+                    self._condition.notify_all()
+                raise
+            if self._waiting[0] is ticket:
+                heapq.heappop(self._waiting)
+            else:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+            self._in_flight += 1
+            if cost and self._bucket is not None:
+                self._bucket.take(cost)
+            statistics.admitted(_now() - queued)
+            self._condition.notify_all()
+
+    def _wait_turn(self, ticket, cost):
+        """
+        Called with the lock held; returns when the ticket is first in
+        the queue, a slot is free, and the tokens are available. A ticket
+        without cost (like SEND_STOP) does not wait for those ahead of it
+        that only wait for tokens, unless they are more urgent.
+        """
+        while True:
+            if ticket[2]:
+                raise SchedulerFullException(
+                    "Dropped for a more urgent command")
+            if self._in_flight >= self.max_in_flight:
+                self._condition.wait()
+            elif self._waiting[0] is ticket:
+                delay = self._bucket.delay(cost) \
+                    if cost and self._bucket is not None else 0
+                if delay <= 0:
+                    return
+                self._condition.wait(delay)
+            elif not cost and self._bucket is not None \
+                    and all(other[3] and other[0] >= ticket[0]
+                            for other in self._waiting if other < ticket):
+                return
+            else:
+                self._condition.wait()
+
+    def _make_room(self, priority, statistics):
+        """Called with the lock held, if the queue is full."""
+        if self.policy == DROP:
+            victim = max(self._waiting)
+            if victim[0] > priority:
+                self._waiting.remove(victim)
+                heapq.heapify(self._waiting)
+                victim[2] = True
+                self._statistics[victim[0]].dropped()
+                self._condition.notify_all()
+                return
+        elif self.policy == BLOCK:
+            deadline = None if self.timeout is None \
+                else _now() + self.timeout
+            while len(self._waiting) >= self.max_queue:
+                remaining = None if deadline is None else deadline - _now()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            else:
+                return
+        statistics.rejected += 1
+        raise SchedulerFullException(
+            "Queue full ({0} commands waiting)".format(len(self._waiting)))
+
+    def _take_tokens(self, cost):
+        if not cost or self._bucket is None:
+            return
+        with self._condition:
+            delay = self._bucket.delay(cost)
+            while delay > 0:
+                self._condition.wait(delay)
+                delay = self._bucket.delay(cost)
+            self._bucket.take(cost)
+
+    def statistics(self):
+        """
+        Returns a dict, per priority class name, of dicts with the
+        current and maximal queue depth, the numbers of admitted,
+        rejected, and dropped commands, and the wait times in seconds
+        (mean, p50, p99, max; None without samples).
+        """
+        with self._condition:
+            return dict((name, stats.snapshot()) for name, stats
+                        in zip(PRIORITY_NAMES, self._statistics))
+
+    def report(self, out):
+        """Prints the statistics, one line per class, times in ms."""
+        print("{0:<12} {1:>6} {2:>6} {3:>8} {4:>8} {5:>7} {6:>9} {7:>9} "
+              "{8:>9}".format("class", "queued", "max", "admitted",
+                              "rejected", "dropped", "wait-p50", "wait-p99",
+                              "wait-max"), file=out)
+        with self._condition:
+            for name, stats in zip(PRIORITY_NAMES, self._statistics):
+                print("{0:<12} {1:>6} {2:>6} {3:>8} {4:>8} {5:>7} {6:>9} "
+                      "{7:>9} {8:>9}".format(
+                          name, stats.queued, stats.max_queued,
+                          stats.wait.count, stats.rejected,
+                          stats.dropped_count,
+                          _milliseconds(stats.wait.percentile(50)),
+                          _milliseconds(stats.wait.percentile(99)),
+                          _milliseconds(stats.wait.maximum)), file=out)
+
+
+class _ClassStatistics(object):
+    def __init__(self):
+        self.queued = 0
+        self.max_queued = 0
+        self.rejected = 0
+        self.dropped_count = 0
+        self.wait = LatencyHistogram()
+
+    def enqueued(self):
+        self.queued += 1
+        self.max_queued = max(self.max_queued, self.queued)
+
+    def admitted(self, wait):
+        self.queued -= 1
+        self.wait.add(wait)
+
+    def dropped(self):
+        self.queued -= 1
+        self.dropped_count += 1
+
+    def snapshot(self):
+        return {
+            'queued': self.queued,
+            'max_queued': self.max_queued,
+            'admitted': self.wait.count,
+            'rejected': self.rejected,
+            'dropped': self.dropped_count,
+            'wait_mean': self.wait.mean,
+            'wait_p50': self.wait.percentile(50),
+            'wait_p99': self.wait.percentile(99),
+            'wait_max': self.wait.maximum,
+        }
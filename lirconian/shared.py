@@ -0,0 +1,214 @@
+# Copyright (C) 2017 Bengt Martensson.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see http://www.gnu.org/licenses/.
+
+"""
+Thread-safe Lirconian, one connection shared by many threads.
+
+Each request/reply cycle is serialized by a lock, held only while the
+packet is written and its reply read. The remote and command used by
+stop_ir() without arguments are remembered per thread.
+
+Selecting the transmitters and sending with them (send_ir_command with
+transmitters, send_ir_command_batch) is done under the lock as a whole.
+With a scheduler (see set_scheduler), the threads wait for their turn
+before taking the lock, so the lock is taken in priority order.
+
+For fire-and-forget transmissions, submit_ir_command() queues a SEND_ONCE
+and returns a Future at once. A single writer thread sends everything
+queued meanwhile in one pipelined write (one per set of transmitters),
+and resolves the Futures when the replies have arrived.
+"""
+
+import select
+import threading
+from concurrent.futures import Future
+
+try:
+    import queue
+except ImportError:                                     # Python 2
+    import Queue as queue
+
+from . import AbstractLirconian, UnixDomainSocketLirconian, TcpLirconian, \
+    DEFAULT_LIRC_DEVICE, DEFAULT_PORT
+from .line_reader import DEFAULT_CHUNK_SIZE
+from .scheduler import INTERACTIVE, CONTROL
+
+# Maximal number of queued commands written together by the writer thread.
+MAX_BATCH = 256
+
+
+class ThreadSafeMixin:
+    """
+    Makes a Lirconian safe to share between threads.
+    To be mixed in before a concrete Lirconian class.
+    """
+
+    def _init_thread_safety(self):
+        # Reentrant, since the composite operations call _send_command.
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._queue = queue.Queue()
+        self._writer = None
+        self._writer_lock = threading.Lock()
+
+    def _serialized(self, packets, priority, function, *args):
+        """
+        Calls function(self, *args) with the lock held, after the
+        admission by the scheduler, if any, which is waited for without
+        the lock.
+        """
+        if self._scheduler is None:
+            with self._lock:
+                return function(self, *args)
+        with self._scheduler.admission(packets, priority):
+            with self._lock:
+                return function(self, *args)
+
+    def _send_command(self, packet):
+        return self._serialized(
+            [packet], None, AbstractLirconian._send_command_unscheduled,
+            packet)
+
+    def _send_commands(self, packets):
+        return self._serialized(
+            packets, None, AbstractLirconian._send_commands_unscheduled,
+            packets)
+
+    def _poll_broadcasts(self, timeout=0):
+        # Wait for input without the lock, not to block the other threads.
+        if timeout != 0 and self._socket is not None:
+            select.select([self._socket], [], [], timeout)
+        with self._lock:
+            AbstractLirconian._poll_broadcasts(self, 0)
+
+    def _poll_before_command(self):
+        with self._lock:
+            AbstractLirconian._poll_before_command(self)
+
+    # The composite operations are admitted with their transmissions,
+    # so that the scheduler's rate limit is waited for without the lock.
+
+    def send_ir_command(self, remote, command, count, transmitters=None):
+        self._serialized([self._send_once_packet(remote, command, count)],
+                         INTERACTIVE, AbstractLirconian.send_ir_command,
+                         remote, command, count, transmitters)
+
+    def send_ir_command_batch(self, sequence):
+        sequence = list(sequence)
+        return self._serialized(
+            [self._send_once_packet(*item[:3]) for item in sequence],
+            INTERACTIVE, AbstractLirconian.send_ir_command_batch, sequence)
+
+    def set_transmitters_mask(self, mask):
+        self._serialized((), CONTROL,
+                         AbstractLirconian.set_transmitters_mask, mask)
+
+    def send_ir_command_repeat(self, remote, command):
+        self._serialized(["SEND_START " + remote + " " + command],
+                         INTERACTIVE,
+                         AbstractLirconian.send_ir_command_repeat,
+                         remote, command)
+        self._local.last = (remote, command)
+
+    def stop_ir(self, remote=None, command=None):
+        last_remote, last_command = getattr(self._local, 'last', (None, None))
+        self._serialized((), INTERACTIVE, AbstractLirconian.stop_ir,
+                         remote or last_remote, command or last_command)
+
+    def submit_ir_command(self, remote, command, count=1, transmitters=None):
+        """
+        Queues the transmission of the command for the writer thread,
+        and returns a concurrent.futures.Future, whose result is None
+        on success; otherwise it holds the exception, for example a
+        LircServerException. If transmitters is given, the command is
+        sent with these transmitters; the commands queued meanwhile are
+        grouped by transmitters, see send_ir_command_batch.
+        """
+        future = Future()
+        self._ensure_writer()
+        self._queue.put(((remote, command, count, transmitters), future))
+        return future
+
+    def _ensure_writer(self):
+        if self._writer is not None:
+            return
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_queued,
+                                                name='lirconian-writer')
+                self._writer.daemon = True
+                self._writer.start()
+
+    def _write_queued(self):
+        """The writer thread: sends the queued commands, pipelined."""
+        while True:
+            batch = [self._queue.get()]
+            while batch[-1] is not None and len(batch) < MAX_BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = batch[-1] is None
+            if stop:
+                batch.pop()
+            if batch:
+                self._write_batch(batch)
+            if stop:
+                return
+
+    def _write_batch(self, batch):
+        try:
+            outcomes = self.send_ir_command_batch([item for item, _ in batch])
+        except Exception as ex:  # pylint: disable=broad-except
+            for _, future in batch:
+                future.set_exception(ex)
+            return
+        for error, (_, future) in zip(outcomes, batch):
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(error)
+
+    def close(self):
+        """Sends the queued commands, then closes the connection."""
+        with self._writer_lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            self._queue.put(None)
+            writer.join()
+        AbstractLirconian.close(self)
+
+
+class ThreadSafeUnixDomainSocketLirconian(ThreadSafeMixin,
+                                          UnixDomainSocketLirconian):
+    """UnixDomainSocketLirconian that may be shared between threads."""
+
+    def __init__(self, socketAddress=DEFAULT_LIRC_DEVICE,
+                 verbose=False, timeout=None,
+                 chunk_size=DEFAULT_CHUNK_SIZE):
+        self._init_thread_safety()
+        UnixDomainSocketLirconian.__init__(self, socketAddress, verbose,
+                                           timeout, chunk_size)
+
+
+class ThreadSafeTcpLirconian(ThreadSafeMixin, TcpLirconian):
+    """TcpLirconian that may be shared between threads."""
+
+    def __init__(self, address="localhost",
+                 port=DEFAULT_PORT, verbose=False, timeout=None,
+                 chunk_size=DEFAULT_CHUNK_SIZE):
+        self._init_thread_safety()
+        TcpLirconian.__init__(self, address, port, verbose, timeout,
+                              chunk_size)
@@ -0,0 +1,148 @@
+# Copyright (C) 2017 Bengt Martensson.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see http://www.gnu.org/licenses/.
+
+"""
+Tracing of the communication with the Lirc server.
+
+In verbose mode, every packet sent and every line received is logged,
+with level DEBUG, to the logger "lirconian.protocol"; the messages are
+only formatted if they are actually emitted. If logging has not been
+configured at all, a handler writing to stdout is installed, so that
+verbose mode works like before.
+
+A capture file records the traffic as JSON lines, with a monotonic
+time stamp, for example
+    {"time": 1234.567890, "direction": "out", "line": "VERSION"}
+    {"time": 1234.568012, "direction": "in", "line": "BEGIN"}
+Captures can be fed back through the reply parsers by lirconian.replay.
+
+This module is only imported when tracing is turned on.
+"""
+
+import json
+import logging
+import sys
+
+from .catalog import _now
+
+LOGGER_NAME = 'lirconian.protocol'
+
+_UNCHANGED = object()
+
+
+class Tracer(object):
+    """
+    Logs (if verbose) and/or captures (if capture is not None) the
+    traffic of one connection. The capture is a path name,
+    or a writable text file.
+    """
+
+    def __init__(self, verbose=False, capture=None):
+        self._logger = None
+        self._capture = None
+        self._owns_capture = False
+        self.set_verbose(verbose)
+        self.set_capture(capture)
+
+    @property
+    def active(self):
+        """True if the tracer logs or captures anything."""
+        return self._logger is not None or self._capture is not None
+
+    def set_verbose(self, verbose):
+        """Turns the logging on or off."""
+        self._logger = _verbose_logger() if verbose else None
+
+    def set_capture(self, capture):
+        """Starts capturing to capture, or stops capturing if None."""
+        self.close()
+        if capture is None:
+            return
+        if hasattr(capture, 'write'):
+            self._capture = capture
+        else:
+            self._capture = open(capture, 'a')
+            self._owns_capture = True
+
+    def close(self):
+        """Stops capturing; closes the capture file if opened here."""
+        if self._capture is not None:
+            if self._owns_capture:
+                self._capture.close()
+            else:
+                self._capture.flush()
+        self._capture = None
+        self._owns_capture = False
+
+    def sent(self, packets, peer):
+        """Traces packets (strings, without newline) sent to peer."""
+        if self._logger is not None:
+            for packet in packets:
+                self._logger.debug("Sending: `%s' to Lirc@%s", packet, peer)
+        if self._capture is not None:
+            now = _now()
+            for packet in packets:
+                self._record(now, 'out', packet)
+
+    def received(self, lines):
+        """Traces lines (bytes or strings, without newline) received."""
+        if self._logger is not None \
+                and self._logger.isEnabledFor(logging.DEBUG):
+            for line in lines:
+                if line:
+                    self._logger.debug('Received: "%s"', _decode(line))
+        if self._capture is not None:
+            now = _now()
+            for line in lines:
+                self._record(now, 'in', _decode(line))
+
+    def _record(self, now, direction, line):
+        self._capture.write(json.dumps(
+            {'time': round(now, 6), 'direction': direction, 'line': line},
+            sort_keys=True) + '\n')
+
+
+def configure(tracer, verbose=_UNCHANGED, capture=_UNCHANGED):
+    """
+    Returns tracer (None, or a Tracer), modified by the arguments given,
+    or None if it would not trace anything.
+    """
+    if tracer is None:
+        tracer = Tracer()
+    if verbose is not _UNCHANGED:
+        tracer.set_verbose(verbose)
+    if capture is not _UNCHANGED:
+        tracer.set_capture(capture)
+    return tracer if tracer.active else None
+
+
+def _decode(line):
+    return line.decode('latin-1') if isinstance(line, bytes) else line
+
+
+def _verbose_logger():
+    """
+    Returns the protocol logger, enabled for DEBUG. If logging has not
+    been configured, a handler printing the bare messages to stdout
+    is added.
+    """
+    logger = logging.getLogger(LOGGER_NAME)
+    if not logger.handlers and not logging.getLogger().handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+    if not logger.isEnabledFor(logging.DEBUG):
+        logger.setLevel(logging.DEBUG)
+    return logger
@@ -0,0 +1,153 @@
+# Copyright (C) 2017 Bengt Martensson.
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or (at
+# your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# this program. If not, see http://www.gnu.org/licenses/.
+
+"""
+Equivalence of FastReplyParser and the reference ReplyParser,
+on packets recorded from lircd.
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                                '..'))
+
+# pylint: disable=wrong-import-position
+from lirconian.reply_parser import ReplyParser, FastReplyParser, \
+    BadPacketException
+from lirconian.line_reader import LineReader
+
+# Replies as received from lircd 0.10, one packet per string; some are
+# preceded by broadcast button events or SIGHUP announcements.
+RECORDED = [
+    b"BEGIN\nVERSION\nSUCCESS\nDATA\n1\n0.10.1\nEND\n",
+    b"BEGIN\nLIST\nSUCCESS\nDATA\n3\nyamaha\ntv\ndenon_amp\nEND\n",
+    b"BEGIN\nLIST yamaha\nSUCCESS\nDATA\n4\n"
+    b"000000007e81e21d KEY_POWER\n000000007e81fa05 KEY_VOLUMEUP\n"
+    b"000000007e817a85 KEY_VOLUMEDOWN\n000000007e811ce3 KEY_MUTE\nEND\n",
+    b"BEGIN\nSEND_ONCE yamaha KEY_POWER 0\nSUCCESS\nEND\n",
+    b"BEGIN\nSEND_START yamaha KEY_VOLUMEUP\nSUCCESS\nEND\n",
+    b"BEGIN\nSEND_STOP yamaha KEY_VOLUMEUP\nSUCCESS\nEND\n",
+    b"BEGIN\nSEND_ONCE yamaha KEY_NOSUCH 0\nERROR\nDATA\n1\n"
+    b"unknown command: \"KEY_NOSUCH\"\nEND\n",
+    b"BEGIN\nLIST nosuch\nERROR\nDATA\n1\nunknown remote: \"nosuch\"\nEND\n",
+    b"BEGIN\nSET_TRANSMITTERS 3\nERROR\nDATA\n1\n"
+    b"hardware does not support multiple transmitters\nEND\n",
+    b"BEGIN\nLIST empty\nSUCCESS\nDATA\n0\nEND\n",
+    b"000000007e81e21d 00 KEY_POWER yamaha\n"
+    b"000000007e81e21d 01 KEY_POWER yamaha\n"
+    b"BEGIN\nVERSION\nSUCCESS\nDATA\n1\n0.10.1\nEND\n",
+    b"BEGIN\nSIGHUP\nEND\n"
+    b"BEGIN\nLIST\nSUCCESS\nDATA\n1\ntv\nEND\n",
+    b"BEGIN\nSEND_ONCE tv KEY_1 0\nSIGHUP\nEND\n"
+    b"BEGIN\nSEND_ONCE tv KEY_1 0\nSUCCESS\nEND\n",
+    b"BEGIN\r\nVERSION\r\nSUCCESS\r\nDATA\r\n1\r\n0.9.4\r\nEND\r\n",
+    b"BEGIN\nLIST tv\nSUCCESS\nDATA\n2\n\n  KEY_1  \n\nKEY_2\nEND\n",
+]
+
+# Packets that both parsers must reject.
+MALFORMED = [
+    b"BEGIN\nVERSION\nMAYBE\nEND\n",
+    b"BEGIN\nVERSION\nSUCCESS\nDATA\none\n0.10.1\nEND\n",
+    b"BEGIN\nVERSION\nSUCCESS\nDATA\n1\n0.10.1\n0.10.2\n",
+    b"BEGIN\nVERSION\nSUCCESS\nEXTRA\nEND\n",
+    b"BEGIN\nSIGHUP\nBEGIN\n",
+]
+
+ACCESSORS = ('result', 'success', 'data', 'sighup', 'command',
+             'is_completed')
+
+
+def _state(parser):
+    return dict((name, getattr(parser, name)) for name in ACCESSORS)
+
+
+class ReplyParserEquivalenceTest(unittest.TestCase):
+    """FastReplyParser agrees with ReplyParser on every line."""
+
+    def _feed(self, reference, fast, line):
+        try:
+            reference.feed(line.decode('US-ASCII'))
+        except BadPacketException:
+            self.assertRaises(BadPacketException, fast.feed, line)
+            return False
+        fast.feed(line)
+        self.assertEqual(_state(fast), _state(reference))
+        self.assertEqual(fast.last_line, reference.last_line)
+        return True
+
+    def test_feed(self):
+        for packet in RECORDED:
+            reference, fast = ReplyParser(), FastReplyParser()
+            for line in packet.splitlines():
+                self.assertTrue(self._feed(reference, fast, line), packet)
+            self.assertTrue(fast.is_completed, packet)
+
+    def test_feed_strings(self):
+        for packet in RECORDED:
+            reference, fast = ReplyParser(), FastReplyParser()
+            for line in packet.decode('US-ASCII').splitlines():
+                reference.feed(line)
+                fast.feed(line)
+            self.assertEqual(_state(fast), _state(reference))
+
+    def test_feed_lines(self):
+        for packet in RECORDED:
+            reference = ReplyParser()
+            for line in packet.splitlines():
+                reference.feed(line.decode('US-ASCII'))
+            lines = packet.splitlines() + [b"BEGIN"]
+            fast = FastReplyParser()
+            consumed = fast.feed_lines(lines)
+            self.assertEqual(_state(fast), _state(reference), packet)
+            self.assertEqual(consumed, len(lines) - 1, packet)
+
+    def test_malformed(self):
+        for packet in MALFORMED:
+            reference, fast = ReplyParser(), FastReplyParser()
+            lines = packet.splitlines()
+            self.assertFalse(all(self._feed(reference, fast, line)
+                                 for line in lines), packet)
+            self.assertRaises(BadPacketException,
+                              FastReplyParser().feed_lines, lines)
+
+    def test_ignored(self):
+        events = []
+        parser = FastReplyParser(events)
+        parser.feed_lines(RECORDED[10].splitlines())
+        self.assertEqual(events, [b"000000007e81e21d 00 KEY_POWER yamaha",
+                                  b"000000007e81e21d 01 KEY_POWER yamaha"])
+        self.assertEqual(parser.data, ["0.10.1"])
+
+
+class LineReaderTest(unittest.TestCase):
+    """LineReader.feed_parser consumes buffered replies in place."""
+
+    def test_pipelined_replies(self):
+        reader = LineReader(64)
+        reader.feed(b"".join(RECORDED) * 200 + b"BEGIN\nVERS")
+        for _ in range(200):
+            for packet in RECORDED:
+                parser = FastReplyParser()
+                consumed = reader.feed_parser(parser)
+                self.assertTrue(parser.is_completed)
+                self.assertEqual(consumed, packet.split(b"\n")[:-1])
+        reader.feed(b"ION\n")
+        self.assertEqual(reader.pop_lines(), [b"BEGIN", b"VERSION"])
+
+
+if __name__ == '__main__':
+    unittest.main()